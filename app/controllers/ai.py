@@ -17,6 +17,10 @@ from platforms import BitflyerClient
 from platforms import Order
 from platforms import Position
 from tradingalgo.algo import ichimoku_cloud
+from tradingalgo.streaming import Atr
+from tradingalgo.streaming import Dmi
+from tradingalgo.streaming import Ema
+from tradingalgo.streaming import IndicatorEngine
 
 import constants
 import settings
@@ -25,22 +29,7 @@ logger = logging.getLogger(__name__)
 
 
 def duration_seconds(duration: str) -> int:
-    if duration == constants.DURATION_5S:
-        return 5
-    if duration == constants.DURATION_1M:
-        return 60
-    if duration == constants.DURATION_5M:
-        return 300
-    if duration == constants.DURATION_15M:
-        return 900
-    if duration == constants.DURATION_30M:
-        return 1800
-    if duration == constants.DURATION_1H:
-        return 60 * 60
-    if duration == constants.DURATION_1D:
-        return 60 * 60 * 24
-    else:
-        return 0
+    return constants.DURATION_SECONDS.get(duration, 0)
 
 
 class AI(object):
@@ -74,6 +63,7 @@ class AI(object):
         self.optimized_trade_params = dict()
         self.params = {'ema_period_1': 5, 'ema_period_2': 25, 'ema_period_3': 50, 'adx_n': 14,
                        'atr_n': 14, 'atr_k_1': 2.0, 'atr_k_2': 0.3}
+        self.indicator_engines = {}
         # self.stop_limit = 0
         # self.atr_buy_stop_limit = 0
         # self.atr_sell_stop_limit = 1000000000
@@ -425,6 +415,36 @@ class AI(object):
             return False
         return True
 
+    def trade_indicator_engine(self):
+        return IndicatorEngine({
+            'ema_1': Ema(self.params['ema_period_1']),
+            'ema_2': Ema(self.params['ema_period_2']),
+            'ema_3': Ema(self.params['ema_period_3']),
+            'dmi': Dmi(self.params['adx_n']),
+            'atr': Atr(self.params['atr_n']),
+            'atr_ema': Ema(self.params['atr_n']),
+        })
+
+    def trade_indicators(self, product_code, tail=10):
+        """Recent candles and indicator values of ``product_code`` for the trade loop.
+
+        The indicators are kept up to date from the last ``tail`` candles
+        and are only recomputed over ``past_period`` candles on the first
+        call, after a gap or when the parameters change.
+        """
+        df = DataFrameCandle(product_code, self.duration)
+        engine, params = self.indicator_engines.get(product_code, (None, None))
+        values = None
+        if engine is not None and params == self.params:
+            values = engine.update(df.set_all_candles(tail))
+        if values is None:
+            engine = self.trade_indicator_engine()
+            values = engine.update(df.set_all_candles(self.past_period))
+            self.indicator_engines[product_code] = engine, dict(self.params)
+        if df.fraction_candle is not None:
+            values = engine.peek(df.append_fraction_candle()[-1])
+        return df, values
+
     def trade(self):
         # if product_code is None:
         #     product_code = self.product_code
@@ -469,24 +489,18 @@ class AI(object):
                     fx_adjustment = 1
                 fx_adjustments[product_code] = fx_adjustment
 
-                df = DataFrameCandle(product_code, self.duration)
-                df.set_recent_candles(self.past_period)
-
-                ema_values_1 = talib.EMA(np.array(df.closes), self.params['ema_period_1'])
-                ema_values_2 = talib.EMA(np.array(df.closes), self.params['ema_period_2'])
-                ema_values_3 = talib.EMA(np.array(df.closes), self.params['ema_period_3'])
-
-                di_plus = talib.PLUS_DI(np.array(df.highs), np.array(df.lows),
-                                        np.array(df.closes), self.params['adx_n'])
-                di_minus = talib.MINUS_DI(np.array(df.highs), np.array(df.lows),
-                                          np.array(df.closes), self.params['adx_n'])
-                adx = talib.ADX(np.array(df.highs), np.array(df.lows),
-                                np.array(df.closes), self.params['adx_n'])
-                adxr = talib.ADXR(np.array(df.highs), np.array(df.lows),
-                                  np.array(df.closes), self.params['adx_n'])
-                atr = talib.ATR(np.array(df.highs), np.array(df.lows),
-                                np.array(df.closes), self.params['atr_n'])
-                mid_list = talib.EMA(np.array(df.closes), self.params['atr_n'])
+                df, values = self.trade_indicators(product_code)
+
+                ema_values_1 = values['ema_1']
+                ema_values_2 = values['ema_2']
+                ema_values_3 = values['ema_3']
+
+                di_plus = [v.plus_di for v in values['dmi']]
+                di_minus = [v.minus_di for v in values['dmi']]
+                adx = [v.adx for v in values['dmi']]
+                adxr = [v.adxr for v in values['dmi']]
+                mid_list = np.array(values['atr_ema'])
+                atr = np.array(values['atr'])
                 atr_up = (mid_list + atr * self.params['atr_k_1']).tolist()
                 atr_down = (mid_list - atr * self.params['atr_k_1']).tolist()
                 atr_up_2 = (mid_list + atr * self.params['atr_k_2']).tolist()
@@ -1064,23 +1078,22 @@ class AI(object):
             df = DataFrameCandle(product_code, duration)
             df.set_all_candles(self.past_period)
 
-            ema_values_1 = talib.EMA(np.array(df.closes), 5)
-            ema_values_2 = talib.EMA(np.array(df.closes), 25)
-            ema_values_3 = talib.EMA(np.array(df.closes), 75)
+            ema_values_1 = df.indicator('EMA', 5)
+            ema_values_2 = df.indicator('EMA', 25)
+            ema_values_3 = df.indicator('EMA', 75)
 
-            bb_up, _, bb_down = talib.BBANDS(np.array(df.closes), 20, 2, 2, 0)
+            bb_up, _, bb_down = df.indicator('BBANDS', 20, 2)
 
-            atr = talib.ATR(np.array(df.highs), np.array(df.lows),
-                            np.array(df.closes), 14)
-            mid_list = talib.EMA(np.array(df.closes), 14)
+            atr = df.indicator('ATR', 14)
+            mid_list = df.indicator('EMA', 14)
             atr_up = (mid_list + atr * 2).tolist()
             atr_down = (mid_list - atr * 2).tolist()
 
-            tenkan, kijun, senkou_a, senkou_b, chikou = ichimoku_cloud(df.closes)
+            tenkan, kijun, senkou_a, senkou_b, chikou = df.indicator('ICHIMOKU')
 
-            rsi_values = talib.RSI(np.array(df.closes), 14)
+            rsi_values = df.indicator('RSI', 14)
 
-            macd, macd_signal, _ = talib.MACD(np.array(df.closes), 12, 26, 9)
+            macd, macd_signal, _ = df.indicator('MACD', 12, 26, 9)
 
             if 75 <= len(df.candles):
                 if ema_values_1[-2] < ema_values_2[-2] and ema_values_1[-1] >= ema_values_2[-1]:
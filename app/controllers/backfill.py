@@ -0,0 +1,178 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timedelta
+import logging
+import sys
+from threading import Lock
+import time
+
+import numpy as np
+
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+from app.models.writer import insert_ignore
+from platforms.base import truncate_timestamps
+from platforms.bitflyer import CandleSource as BitflyerCandleSource
+from platforms.oanda import CandleSource as OandaCandleSource
+
+import constants
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter(object):
+    """Token bucket shared by the backfill workers.
+
+    ``acquire`` reserves a token and sleeps outside the lock until it is
+    due, so waiting workers do not hold each other up.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+
+
+def candle_source(client=settings.client):
+    if client.lower() == 'oanda':
+        return OandaCandleSource(settings.oanda_access_token, environment=settings.live_practice,
+                                 base_url=settings.backfill_oanda_url or None)
+    return BitflyerCandleSource(base_url=settings.backfill_cryptowatch_url)
+
+
+def aligned(times, duration):
+    """``times`` as datetime64 floored on the start of their ``duration`` candle."""
+    seconds = np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+    return truncate_timestamps(seconds, duration).astype('datetime64[s]')
+
+
+def missing_ranges(cls, duration, start, end):
+    """``(gap_start, gap_end)`` ranges between ``start`` and ``end`` with no stored candle.
+
+    ``start`` is aligned down on the duration. Every gap of the window is
+    returned, oldest first, not only the one after the newest stored
+    candle, so downtime in the middle of a table is filled too. Periods
+    the market was closed show up as gaps as well, the source simply has
+    no candle for them.
+    """
+    step = np.timedelta64(constants.DURATION_SECONDS[duration], 's')
+    expected = aligned([start], duration)[0]
+    ranges = []
+    for block in cls.get_candles_between(expected.astype(object), end):
+        times = block.time
+        previous = np.concatenate(([expected], times[:-1] + step))
+        missing = times > previous
+        ranges.extend(zip(previous[missing].astype(object), times[missing].astype(object)))
+        expected = times[-1] + step
+    if expected.astype(object) < end:
+        ranges.append((expected.astype(object), end))
+    return ranges
+
+
+def backfill_table(source, limiter, product_code, duration, start=None, end=None, days=None):
+    """Page candles of one product/duration from ``source`` into the missing ranges.
+
+    The window starts at ``start``, else ``days`` ago. Existing rows are
+    kept (INSERT IGNORE). Returns the number of candles fetched.
+    """
+    if days is None:
+        days = settings.backfill_days
+    cls = factory_candle_class(product_code, duration)
+    if cls is None or not source.supports(duration):
+        return 0
+    table = cls._model().__table__
+    if end is None:
+        end = datetime.utcnow()
+    if start is None:
+        start = end.replace(microsecond=0) - timedelta(days=days)
+
+    fetched = 0
+    fetched_until = start
+    for gap_start, gap_end in missing_ranges(cls, duration, start, end):
+        # A page runs past its gap and may already have filled the next ones.
+        start = max(gap_start, fetched_until)
+        while start < gap_end:
+            limiter.acquire()
+            candles = [c for c in source.fetch(product_code, duration, start) if start <= c[0] < end]
+            if not candles:
+                break
+            times = aligned([candle[0] for candle in candles], duration).astype(object)
+            rows = [cls._row(time=t, open=o, close=c, high=h, low=l, volume=v)
+                    for t, (_, o, c, h, l, v) in zip(times, candles)]
+            with session_scope(table=table) as session:
+                session.execute(insert_ignore(session, table), rows)
+            fetched += len(rows)
+            start = fetched_until = times[-1] + timedelta(seconds=constants.DURATION_SECONDS[duration])
+    return fetched
+
+
+def backfill(source=None, product_codes=None, durations=None, start=None, end=None,
+             workers=None, rate=None, days=None):
+    """Backfill every product/duration concurrently under one rate limit."""
+    if source is None:
+        source = candle_source()
+    if product_codes is None:
+        product_codes = settings.product_codes.split(',')
+    if durations is None:
+        durations = list(constants.TRADE_MAP.keys())
+    if workers is None:
+        workers = settings.backfill_workers
+    if rate is None:
+        rate = settings.backfill_requests_per_second
+    limiter = RateLimiter(rate)
+    keys = [(product_code, duration) for product_code in product_codes for duration in durations]
+
+    def run(key):
+        started = time.perf_counter()
+        try:
+            count = backfill_table(source, limiter, *key, start=start, end=end, days=days)
+        except Exception as e:
+            logger.error(f'action=backfill product_code={key[0]} duration={key[1]} error={e}')
+            return 0
+        logger.info(f'action=backfill product_code={key[0]} duration={key[1]} '
+                    f'candles={count} elapsed={time.perf_counter() - started:.2f}')
+        return count
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = dict(zip(keys, executor.map(run, keys)))
+    logger.info(f'action=backfill status=done candles={sum(counts.values())} '
+                f'rate_limited={limiter.waited:.2f}')
+    return counts
+
+
+def main():
+    parser = ArgumentParser(description='Fill candle gaps from the broker candle history')
+    parser.add_argument('--product-codes', help='comma separated, default: all')
+    parser.add_argument('--durations', help='comma separated, default: all of TRADE_MAP')
+    parser.add_argument('--days', type=int, default=settings.backfill_days,
+                        help='how far back to look for missing candles')
+    parser.add_argument('--workers', type=int, default=settings.backfill_workers)
+    parser.add_argument('--rate', type=float, default=settings.backfill_requests_per_second,
+                        help='requests per second over all workers')
+    args = parser.parse_args()
+
+    product_codes = args.product_codes.split(',') if args.product_codes else None
+    durations = args.durations.split(',') if args.durations else None
+    backfill(product_codes=product_codes, durations=durations, workers=args.workers,
+             rate=args.rate, days=args.days)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    main()
@@ -0,0 +1,96 @@
+import logging
+import queue
+from threading import Lock
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class ProductPipeline(object):
+    """Worker thread consuming the tickers of a single product in order."""
+
+    def __init__(self, product_code, handler, max_queue_size=10000):
+        self.product_code = product_code
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.processed = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.thread = Thread(target=self._run, name=f'pipeline-{product_code}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def put(self, ticker):
+        self.queue.put(ticker)
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def _run(self):
+        while True:
+            ticker = self.queue.get()
+            if ticker is _STOP:
+                return
+            try:
+                self.handler(ticker)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f'action=pipeline product_code={self.product_code} error={e}')
+
+    def stop(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    @property
+    def value(self):
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+
+class TickDispatcher(object):
+    """Routes each ticker to the pipeline of its product code.
+
+    Pipelines are created on the first ticker of a product, so a busy
+    instrument only delays its own candle updates. A full pipeline queue
+    blocks the caller, which pushes back on the stream reader.
+    """
+
+    def __init__(self, handler, max_queue_size=10000):
+        self.handler = handler
+        self.max_queue_size = max_queue_size
+        self.pipelines = {}
+        self.lock = Lock()
+
+    def dispatch(self, ticker):
+        pipeline = self.pipelines.get(ticker.product_code)
+        if pipeline is None:
+            pipeline = self._create(ticker.product_code)
+        pipeline.put(ticker)
+
+    def _create(self, product_code):
+        with self.lock:
+            pipeline = self.pipelines.get(product_code)
+            if pipeline is None:
+                pipeline = ProductPipeline(product_code, self.handler, self.max_queue_size).start()
+                self.pipelines[product_code] = pipeline
+                logger.info(f'action=create_pipeline product_code={product_code}')
+            return pipeline
+
+    def stop(self):
+        with self.lock:
+            pipelines = list(self.pipelines.values())
+        for pipeline in pipelines:
+            pipeline.stop()
+
+    @property
+    def value(self):
+        return {product_code: pipeline.value for product_code, pipeline in self.pipelines.items()}
@@ -0,0 +1,84 @@
+from argparse import ArgumentParser
+from collections import defaultdict
+import json
+import logging
+import sys
+
+from app.controllers.streamdata import StreamData
+from app.models.candle import factory_candle_class
+from app.models.journal import read_ticks
+from app.models.writer import CandleWriter
+from platforms import ReplayClient
+from platforms.replay import ticks_from_candles
+from platforms.replay import ticks_from_journal
+
+import constants
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayReport(object):
+    def __init__(self, stream: StreamData, client: ReplayClient):
+        self.ticks = client.count
+        self.elapsed = client.elapsed
+        self.ticks_per_second = client.ticks_per_second
+        self.stage_seconds = defaultdict(float)
+        for stages in stream.stage_seconds.values():
+            for stage, seconds in stages.items():
+                self.stage_seconds[stage] += seconds
+        self.stage_seconds['flush'] = stream.writer.metrics['total_flush_ms'] / 1000
+        self.created_candles = defaultdict(int)
+        self.late_ticks = 0
+        for aggregator in stream.aggregators.values():
+            for duration, count in aggregator.created_candles.items():
+                self.created_candles[duration] += count
+            self.late_ticks += aggregator.late_ticks
+        self.trade_triggers = sum(stream.trade_triggers.values())
+        self.writer = dict(stream.writer.metrics)
+
+    @property
+    def value(self):
+        return self.__dict__
+
+
+def run_replay(ticks, persist=False):
+    """Push ``ticks`` through StreamData.trade as fast as possible.
+
+    The candle pipeline runs as in production, without an AI and in the
+    calling thread so that timings are not blurred by the pipeline queues.
+    The candles are rebuilt from the ticks alone, not seeded from the
+    stored rows. Unless ``persist`` is set the writer batches the candles
+    but does not write them.
+    """
+    client = ReplayClient(ticks)
+    stream = StreamData(client='replay', api=client, writer=CandleWriter(dry_run=not persist))
+    stream.stream_ingestion_data(sharded=False)
+    return ReplayReport(stream, client)
+
+
+def main():
+    parser = ArgumentParser(description='Replay journaled ticks or stored 5S candles through the ingestion pipeline')
+    parser.add_argument('--product-code', default=settings.product_code)
+    parser.add_argument('--limit', default=100000, type=int, help='number of 5S candles to replay')
+    parser.add_argument('--journal', help='replay ticks from this tick journal directory instead')
+    parser.add_argument('--start', type=float, help='journal range start, epoch seconds')
+    parser.add_argument('--end', type=float, help='journal range end, epoch seconds')
+    parser.add_argument('--persist', action='store_true', help='write the produced candles')
+    args = parser.parse_args()
+    if args.journal and (args.start is None or args.end is None):
+        parser.error('--journal requires --start and --end')
+
+    if args.journal:
+        ticks = ticks_from_journal(read_ticks(args.journal, args.start, args.end, args.product_code))
+    else:
+        candles = factory_candle_class(args.product_code, constants.DURATION_5S).get_all_candles(args.limit)
+        ticks = ticks_from_candles(args.product_code, candles)
+    report = run_replay(ticks, persist=args.persist)
+    json.dump(report.value, sys.stdout, indent=2, default=str)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    main()
@@ -1,12 +1,16 @@
+from collections import defaultdict
 import datetime
 from functools import partial
 import logging
 from threading import Lock
-from threading import Thread
 import time
 
 from app.controllers.ai import AI
-from app.models.candle import create_candle_with_duration
+from app.controllers.dispatcher import TickDispatcher
+from app.controllers.tradepool import TradeWorkerPool
+from app.models.aggregator import CandleAggregator
+from app.models.journal import TickJournal
+from app.models.writer import CandleWriter
 from platforms import Ticker
 
 import constants
@@ -17,7 +21,8 @@ logger = logging.getLogger(__name__)
 
 class StreamData(object):
 
-    def __init__(self, client="oanda"):
+    def __init__(self, client="oanda", api=None, writer=None, journal=None):
+        self.ai = None
         if client == "oanda":
             self.ai = AI(
                 product_code=settings.product_code,
@@ -38,18 +43,73 @@ class StreamData(object):
                 back_test=settings.back_test,
                 live_practice=settings.live_practice,
                 client="bitflyer")
+        # client == "replay" runs the candle pipeline without an AI.
+        self.api = api if api is not None else self.ai.API
+        # Trades stay serialized; the pool coalesces triggers off the stream thread.
         self.trade_lock = Lock()
+        self.trade_pool = TradeWorkerPool(self._trade).start()
+        if writer is None:
+            writer = CandleWriter()
+        self.writer = writer.start()
+        if journal is None and client != "replay" and settings.tick_journal_dir:
+            journal = TickJournal(settings.tick_journal_dir, settings.tick_journal_flush_interval)
+        self.journal = journal
+        # A replay rebuilds its candles from scratch rather than from the stored rows.
+        self.seed_candles = client != "replay"
+        self.aggregators = {}
+        self.aggregators_lock = Lock()
+        self.dispatcher = None
+        # Keyed by product code so that each pipeline thread only writes its own entry.
+        self.stage_seconds = defaultdict(lambda: defaultdict(float))
+        self.trade_triggers = defaultdict(int)
         # self.trade_duration = settings.trade_duration
         # self.change_time = None
 
-    def stream_ingestion_data(self):
+    def aggregator_for(self, product_code):
+        aggregator = self.aggregators.get(product_code)
+        if aggregator is None:
+            with self.aggregators_lock:
+                aggregator = self.aggregators.get(product_code)
+                if aggregator is None:
+                    aggregator = CandleAggregator(writer=self.writer, seed=self.seed_candles)
+                    self.aggregators[product_code] = aggregator
+        return aggregator
+
+    def stream_ingestion_data(self, sharded=True):
         trade_with_ai = partial(self.trade, ai=self.ai)
-        self.ai.API.get_realtime_ticker(callback=trade_with_ai)
+        callback = trade_with_ai
+        if sharded:
+            self.dispatcher = TickDispatcher(trade_with_ai)
+            callback = self.dispatcher.dispatch
+        if self.journal is not None:
+            callback = partial(self._journal_and_dispatch, callback=callback)
+        try:
+            self.api.get_realtime_ticker(callback=callback)
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+            if self.dispatcher is not None:
+                self.dispatcher.stop()
+            for aggregator in list(self.aggregators.values()):
+                aggregator.checkpoint()
+            self.writer.stop()
+            self.trade_pool.stop(timeout=5)
+
+    def _journal_and_dispatch(self, ticker: Ticker, callback):
+        try:
+            self.journal.append(ticker)
+        except ValueError as e:
+            logger.error(f'action=journal error={e}')
+        callback(ticker)
 
     def trade(self, ticker: Ticker, ai: AI):
-        logger.info(f'action=trade ticker={ticker.__dict__}')
+        logger.debug(f'action=trade ticker={ticker.__dict__}')
+        stage_seconds = self.stage_seconds[ticker.product_code]
+        start = time.perf_counter()
+        created_durations = self.aggregator_for(ticker.product_code).update(ticker)
+        stage_seconds['aggregate'] += time.perf_counter() - start
         for duration in constants.DURATIONS:
-            is_created = create_candle_with_duration(ticker.product_code, duration, ticker)
+            is_created = duration in created_durations
             # if true_range > 2 * atr and self.trade_duration == "15m":
             #     self.trade_duration = "5m"
             #     self.change_time = time.time()
@@ -62,8 +122,12 @@ class StreamData(object):
             # elif self.trade_duration == "5m" and time.time() - self.change_time > 3200:
             #     self.trade_duration = "15m"
             if is_created and duration == settings.trade_duration:
-                thread = Thread(target=self._trade, args=(ai, ticker,))
-                thread.start()
+                self.trade_triggers[ticker.product_code] += 1
+                if ai is None:
+                    continue
+                start = time.perf_counter()
+                self.trade_pool.submit(ticker.product_code, ai, ticker)
+                stage_seconds['dispatch'] += time.perf_counter() - start
 
     def _trade(self, ai: AI, ticker: Ticker):
         with self.trade_lock:
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+import logging
+from threading import Condition
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+
+class TradeWorkerPool(object):
+    """Fixed set of worker threads running trade triggers.
+
+    Pending triggers are kept per key (the product code). A newer trigger
+    for a key that is still waiting replaces the older one, and a key is
+    never run by two workers at once. When ``max_pending`` keys are waiting
+    further triggers are dropped.
+
+    The pool takes trades off the streaming thread and coalesces them; it
+    does not run them in parallel when ``handler`` serializes on a lock of
+    its own, as ``StreamData._trade`` does. More workers only help a
+    handler that can run concurrently for different keys.
+    """
+
+    def __init__(self, handler, num_workers=1, max_pending=64):
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.running = set()
+        self.condition = Condition()
+        self.threads = []
+        self.stopping = False
+        self.metrics = {
+            'submitted': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'processed': 0,
+            'errors': 0,
+            'max_queue_depth': 0,
+        }
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = Thread(target=self._work, name=f'trade-worker-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    @property
+    def queue_depth(self):
+        return len(self.pending)
+
+    def submit(self, key, *args):
+        with self.condition:
+            if key in self.pending:
+                self.pending[key] = args
+                self.metrics['coalesced'] += 1
+                return True
+            if len(self.pending) >= self.max_pending:
+                self.metrics['dropped'] += 1
+                logger.warning(f'action=submit error=queue_full key={key}')
+                return False
+            self.pending[key] = args
+            self.metrics['submitted'] += 1
+            self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], len(self.pending))
+            self.condition.notify()
+            return True
+
+    def _next(self):
+        for key in self.pending:
+            if key not in self.running:
+                return key, self.pending.pop(key)
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                item = self._next()
+                while item is None and not self.stopping:
+                    self.condition.wait()
+                    item = self._next()
+                if item is None:
+                    return
+                key, args = item
+                self.running.add(key)
+
+            result = 'processed'
+            try:
+                self.handler(*args)
+            except Exception as e:
+                result = 'errors'
+                logger.error(f'action=trade_worker key={key} error={e}')
+            finally:
+                with self.condition:
+                    self.metrics[result] += 1
+                    self.running.discard(key)
+                    self.condition.notify_all()
+
+    def stop(self, timeout=None):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
@@ -3,7 +3,16 @@ from flask import jsonify
 from flask import render_template
 from flask import request
 
+from app.models.base import lock_stats_value
 from app.models.dfcandle import DataFrameCandle
+from app.models.dfcandle import indicator_cache
+from app.models.encoding import BINARY_MIMETYPE
+from app.models.encoding import dumps
+from app.models.encoding import FORMAT_BINARY
+from app.models.encoding import FORMAT_COLUMNS
+from app.models.encoding import FORMAT_JSON
+from app.models.encoding import FORMATS
+from app.models.encoding import pack
 
 import constants
 import settings
@@ -11,6 +20,10 @@ import settings
 app = Flask(__name__, template_folder='../views')
 
 
+def json_response(value, status=200):
+    return app.response_class(dumps(value) + '\n', status=status, mimetype='application/json')
+
+
 @app.teardown_appcontext
 def remove_session(ex=None):
     from app.models.base import Session
@@ -22,12 +35,24 @@ def index():
     return render_template('./chart.html')
 
 
+@app.route('/api/stats/', methods=['GET'])
+def api_stats():
+    return json_response({
+        'db_locks': lock_stats_value(),
+        'indicator_cache': indicator_cache.value,
+    })
+
+
 @app.route('/api/candle/', methods=['GET'])
 def api_make_handler():
     product_code = request.args.get('product_code')
     if not product_code:
         return jsonify({'error': 'No product_code params'}), 400
 
+    response_format = request.args.get('format', FORMAT_JSON)
+    if response_format not in FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(FORMATS)}'}), 400
+
     limit_str = request.args.get('limit')
     limit = 1000
     if limit_str:
@@ -188,7 +213,11 @@ def api_make_handler():
     if events:
         df.add_events(df.candles[0].time)
 
-    return jsonify(df.value), 200
+    if response_format == FORMAT_BINARY:
+        return app.response_class(pack(df.columnar_value), mimetype=BINARY_MIMETYPE)
+    if response_format == FORMAT_COLUMNS:
+        return json_response(df.columnar_value)
+    return json_response(df.value)
 
 
 def start():
@@ -0,0 +1,273 @@
+from collections import defaultdict
+from collections import OrderedDict
+import logging
+import time
+
+from app.models.candle import factory_candle_class
+
+import constants
+
+logger = logging.getLogger(__name__)
+
+
+class OpenCandle(object):
+    """Candle being built in memory.
+
+    ``counted_volume`` is the part of ``volume`` already included in the
+    stored coarser candles, when the candle was seeded from the database;
+    folding it into its parent only adds the rest.
+    """
+    __slots__ = ('time', 'open', 'close', 'high', 'low', 'volume', 'dirty', 'counted_volume')
+
+    def __init__(self, time, open=None, close=None, high=None, low=None, volume=0, dirty=True,
+                 counted_volume=0):
+        self.time = time
+        self.open = open
+        self.close = close
+        self.high = high
+        self.low = low
+        self.volume = volume
+        self.dirty = dirty
+        self.counted_volume = counted_volume
+
+    def copy(self):
+        return OpenCandle(self.time, self.open, self.close, self.high, self.low,
+                          self.volume, self.dirty, self.counted_volume)
+
+    @property
+    def is_empty(self):
+        return self.open is None
+
+    def add(self, price, volume):
+        if self.is_empty:
+            self.open = self.high = self.low = price
+        if self.high < price:
+            self.high = price
+        if self.low > price:
+            self.low = price
+        self.close = price
+        self.volume += volume
+        self.dirty = True
+
+    def add_late(self, price, volume):
+        """Merge a tick older than the close: it can move high and low, not open or close."""
+        if self.is_empty:
+            self.add(price, volume)
+            return
+        if self.high < price:
+            self.high = price
+        if self.low > price:
+            self.low = price
+        self.volume += volume
+        self.dirty = True
+
+    def fold(self, candle):
+        """Merge a candle of a finer duration that follows the ones already folded."""
+        if self.is_empty:
+            self.open = candle.open
+            self.high = candle.high
+            self.low = candle.low
+        else:
+            if self.high < candle.high:
+                self.high = candle.high
+            if self.low > candle.low:
+                self.low = candle.low
+        self.close = candle.close
+        self.volume += candle.volume - candle.counted_volume
+        self.dirty = True
+
+
+class CandleAggregator(object):
+    """Keeps the open candle of every (product_code, duration) in memory.
+
+    Ticks only update the finest candle (5S). When it closes it is folded
+    into the next coarser candle, which is in turn folded into the next one
+    when it closes, along ``constants.DURATIONS``. The database is written
+    when a candle closes or on a periodic checkpoint, which writes every
+    open candle merged with its open finer candles.
+
+    On the first tick of a product the open candles are seeded from the
+    stored rows, unless ``seed`` is False: a replay rebuilds the candles of
+    ticks that are already stored and would count them twice.
+
+    The last ``late_tick_window`` closed candles of each duration stay in
+    memory, so that a late tick updates the same candle objects and goes
+    through the writer queue after the rows it amends.
+    """
+
+    def __init__(self, durations=None, checkpoint_interval=5.0, writer=None, late_tick_window=120,
+                 seed=True):
+        if durations is None:
+            durations = constants.DURATIONS
+        self.durations = durations
+        self.seed = seed
+        self.checkpoint_interval = checkpoint_interval
+        self.writer = writer
+        self.open_candles = {}
+        self.late_tick_window = late_tick_window
+        self.closed_candles = defaultdict(OrderedDict)
+        self.late_ticks = 0
+        self.created_candles = defaultdict(int)
+        self.last_checkpoint = time.monotonic()
+
+    def update(self, ticker):
+        """Apply a ticker and return the durations whose candle was created by it."""
+        base_key = (ticker.product_code, self.durations[0])
+        ticker_time = ticker.truncate_date_time(self.durations[0])
+        candle = self.open_candles.get(base_key)
+
+        if candle is None:
+            created = self._load(ticker)
+        elif candle.time == ticker_time:
+            candle.add(ticker.mid_price, ticker.volume)
+            created = []
+        elif candle.time > ticker_time:
+            self._apply_late_tick(ticker)
+            created = []
+        else:
+            created = self._roll(ticker, ticker_time, candle)
+
+        for duration in created:
+            self.created_candles[duration] += 1
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        return created
+
+    def _load(self, ticker):
+        """Seed every duration of a product from the database on its first tick.
+
+        A stored candle already includes its stored finer candles, so the
+        volume they were seeded with is not folded into it again.
+        """
+        created = []
+        for i, duration in enumerate(self.durations):
+            ticker_time = ticker.truncate_date_time(duration)
+            stored = None
+            if self.seed:
+                stored = factory_candle_class(ticker.product_code, duration).get(ticker_time)
+            if stored is None:
+                candle = OpenCandle(ticker_time)
+                created.append(duration)
+            else:
+                candle = OpenCandle(stored.time, stored.open, stored.close,
+                                    stored.high, stored.low, stored.volume, dirty=False,
+                                    counted_volume=stored.volume)
+            if i == 0:
+                candle.add(ticker.mid_price, ticker.volume)
+            self.open_candles[(ticker.product_code, duration)] = candle
+        return created
+
+    def _roll(self, ticker, ticker_time, closed):
+        """Close the finest candle, cascade it upwards and open the new buckets."""
+        product_code = ticker.product_code
+        base_duration = self.durations[0]
+        self._close((product_code, base_duration), closed)
+        candle = OpenCandle(ticker_time)
+        candle.add(ticker.mid_price, ticker.volume)
+        self.open_candles[(product_code, base_duration)] = candle
+        created = [base_duration]
+
+        child = closed
+        for duration in self.durations[1:]:
+            key = (product_code, duration)
+            parent = self.open_candles[key]
+            if not child.is_empty:
+                parent.fold(child)
+
+            new_time = ticker.truncate_date_time(duration)
+            if new_time == parent.time:
+                break
+
+            self._close(key, parent)
+            self.open_candles[key] = OpenCandle(new_time)
+            created.append(duration)
+            child = parent
+        return created
+
+    def _close(self, key, candle):
+        self._persist(key, candle)
+        self._remember(key, candle)
+
+    def _remember(self, key, candle):
+        closed = self.closed_candles[key]
+        closed[candle.time] = candle
+        while len(closed) > self.late_tick_window:
+            closed.popitem(last=False)
+
+    def _apply_late_tick(self, ticker):
+        # Ticks are expected in order. An out of order tick is merged into its
+        # closed candles, a recently closed one kept in memory or the stored
+        # one, which are persisted again, up to the first open candle. That
+        # one passes it on to the coarser candles when it closes.
+        self.late_ticks += 1
+        logger.warning(f'action=update error=late_tick product_code={ticker.product_code}')
+        for duration in self.durations:
+            key = (ticker.product_code, duration)
+            ticker_time = ticker.truncate_date_time(duration)
+            candle = self.open_candles[key]
+            if candle.time == ticker_time:
+                candle.add_late(ticker.mid_price, ticker.volume)
+                break
+            candle = self.closed_candles[key].get(ticker_time)
+            if candle is None:
+                candle = self._load_closed(key, ticker_time)
+                self._remember(key, candle)
+            candle.add_late(ticker.mid_price, ticker.volume)
+            self._persist(key, candle)
+
+    def _load_closed(self, key, candle_time):
+        product_code, duration = key
+        stored = factory_candle_class(product_code, duration).get(candle_time)
+        if stored is None:
+            return OpenCandle(candle_time)
+        return OpenCandle(stored.time, stored.open, stored.close,
+                          stored.high, stored.low, stored.volume, dirty=False)
+
+    def _persist(self, key, candle):
+        """Write ``candle`` if it changed; returns False when it could not be written."""
+        if not candle.dirty or candle.is_empty:
+            return True
+        product_code, duration = key
+        cls = factory_candle_class(product_code, duration)
+        if self.writer is not None:
+            if self.writer.put(cls, candle.time, candle.open, candle.close,
+                               candle.high, candle.low, candle.volume):
+                candle.dirty = False
+                return True
+            return False
+        try:
+            cls.upsert(candle.time, candle.open, candle.close,
+                       candle.high, candle.low, candle.volume)
+            candle.dirty = False
+            return True
+        except Exception as e:
+            logger.error(f'action=persist key={key} error={e}')
+            return False
+
+    def current(self, product_code, duration):
+        """Open candle of ``duration`` merged with the open candles of the finer durations."""
+        index = self.durations.index(duration)
+        candle = self.open_candles[(product_code, duration)].copy()
+        for finer in reversed(self.durations[:index]):
+            child = self.open_candles[(product_code, finer)]
+            if not child.is_empty:
+                candle.fold(child)
+        return candle
+
+    def checkpoint(self):
+        """Write the open candles, merged with their finer ones, that changed."""
+        for product_code in {product_code for product_code, _ in self.open_candles}:
+            keys = [(product_code, duration) for duration in self.durations]
+            changed = False
+            written = True
+            for key in keys:
+                # A change in a finer candle changes every coarser merged one.
+                changed = changed or self.open_candles[key].dirty
+                if changed:
+                    candle = self.current(*key)
+                    candle.dirty = True
+                    written = self._persist(key, candle) and written
+            if changed and written:
+                for key in keys:
+                    self.open_candles[key].dirty = False
+        self.last_checkpoint = time.monotonic()
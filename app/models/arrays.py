@@ -0,0 +1,104 @@
+from collections import namedtuple
+
+import numpy as np
+
+CANDLE_FIELDS = ('time', 'open', 'close', 'high', 'low', 'volume')
+
+
+class CandleRow(namedtuple('CandleRow', CANDLE_FIELDS)):
+    __slots__ = ()
+
+    @property
+    def value(self):
+        return self._asdict()
+
+
+class CandleArrays(object):
+    """Candles of one product/duration held as one contiguous array per column.
+
+    ``time`` is ``datetime64[s]`` and the price and volume columns are
+    ``float64``, so they can be handed to talib or numpy without copying.
+    Rows and ``value`` give the volume back as an int, as the candle
+    tables store it.
+    """
+
+    __slots__ = CANDLE_FIELDS
+
+    def __init__(self, time, open, close, high, low, volume):
+        self.time = time
+        self.open = open
+        self.close = close
+        self.high = high
+        self.low = low
+        self.volume = volume
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype='datetime64[s]'),
+                   *[np.empty(0, dtype=np.float64) for _ in CANDLE_FIELDS[1:]])
+
+    @classmethod
+    def from_candles(cls, candles):
+        """Build the arrays from objects with candle attributes, e.g. ORM candles."""
+        return cls.from_rows([tuple(getattr(candle, field) for field in CANDLE_FIELDS)
+                              for candle in candles])
+
+    @classmethod
+    def concatenate(cls, blocks):
+        return cls(*[np.concatenate([getattr(block, field) for block in blocks])
+                     for field in CANDLE_FIELDS])
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build the arrays from ``columns`` as returned by ``columns``, lists or arrays."""
+        return cls(np.asarray(columns['time'], dtype=np.int64).astype('datetime64[s]'),
+                   *[np.asarray(columns[field], dtype=np.float64) for field in CANDLE_FIELDS[1:]])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build the arrays from (time, open, close, high, low, volume) rows."""
+        if not rows:
+            return cls.empty()
+        time, open, close, high, low, volume = zip(*rows)
+        return cls(np.array(time, dtype='datetime64[s]'),
+                   np.array(open, dtype=np.float64),
+                   np.array(close, dtype=np.float64),
+                   np.array(high, dtype=np.float64),
+                   np.array(low, dtype=np.float64),
+                   np.array(volume, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CandleArrays(*[getattr(self, field)[index] for field in CANDLE_FIELDS])
+        return CandleRow(self.time[index].astype(object), float(self.open[index]),
+                         float(self.close[index]), float(self.high[index]),
+                         float(self.low[index]), int(self.volume[index]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_records(self):
+        """Copy the columns into one structured array."""
+        records = np.empty(len(self), dtype=[(field, getattr(self, field).dtype)
+                                             for field in CANDLE_FIELDS])
+        for field in CANDLE_FIELDS:
+            records[field] = getattr(self, field)
+        return records
+
+    @property
+    def columns(self):
+        """Columns by name, ``time`` as int64 epoch seconds and ``volume`` as int64."""
+        columns = {field: getattr(self, field) for field in CANDLE_FIELDS}
+        columns['time'] = self.time.astype('datetime64[s]').astype(np.int64)
+        columns['volume'] = self.volume.astype(np.int64)
+        return columns
+
+    @property
+    def value(self):
+        columns = [self.time.astype(object).tolist(), self.open.tolist(), self.close.tolist(),
+                   self.high.tolist(), self.low.tolist(), self.volume.astype(np.int64).tolist()]
+        return [dict(zip(CANDLE_FIELDS, row)) for row in zip(*columns)]
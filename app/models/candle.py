@@ -1,14 +1,21 @@
-
 from _datetime import datetime
 import logging
 
+from sqlalchemy import and_
+from sqlalchemy import asc
 from sqlalchemy import Column
 from sqlalchemy import desc
 from sqlalchemy import DateTime
 from sqlalchemy import Float
+from sqlalchemy import func
 from sqlalchemy import Integer
+from sqlalchemy import PrimaryKeyConstraint
+from sqlalchemy import select
+from sqlalchemy import String
 from sqlalchemy.exc import IntegrityError
 
+from app.models.arrays import CANDLE_FIELDS
+from app.models.arrays import CandleArrays
 from app.models.base import Base
 from app.models.base import session_scope
 
@@ -19,24 +26,56 @@ import settings
 logger = logging.getLogger(__name__)
 
 
-class BaseCandleMixin(object):
-    time = Column(DateTime, primary_key=True, nullable=False)
-    open = Column(Float)
-    close = Column(Float)
-    high = Column(Float)
-    low = Column(Float)
-    volume = Column(Integer)
+class CandleQueryMixin(object):
+    """Candle queries that do not depend on how the candles are stored.
+
+    ``_model`` is the mapped class holding the rows, ``_criteria`` the
+    filters selecting this product/duration in it and ``_build`` creates a
+    row of this product/duration.
+    """
+
+    @classmethod
+    def _model(cls):
+        return cls
+
+    @classmethod
+    def _criteria(cls):
+        return []
+
+    @classmethod
+    def _row(cls, **values):
+        return values
+
+    @classmethod
+    def _build(cls, **values):
+        return cls._model()(**cls._row(**values))
+
+    @classmethod
+    def _query(cls, session):
+        query = session.query(cls._model())
+        for criterion in cls._criteria():
+            query = query.filter(criterion)
+        return query
+
+    @classmethod
+    def _select(cls):
+        """Core select of the candle columns, without ORM instances."""
+        model = cls._model()
+        query = select([getattr(model, field) for field in CANDLE_FIELDS])
+        for criterion in cls._criteria():
+            query = query.where(criterion)
+        return query
 
     @classmethod
     def create(cls, time, open, close, high, low, volume):
-        candle = cls(time=time,
-                     open=open,
-                     close=close,
-                     high=high,
-                     low=low,
-                     volume=volume)
+        candle = cls._build(time=time,
+                            open=open,
+                            close=close,
+                            high=high,
+                            low=low,
+                            volume=volume)
         try:
-            with session_scope() as session:
+            with session_scope(table=cls._model().__table__) as session:
                 session.add(candle)
             return candle
         except IntegrityError:
@@ -44,22 +83,32 @@ class BaseCandleMixin(object):
 
     @classmethod
     def get(cls, time):
-        with session_scope() as session:
-            candle = session.query(cls).filter(
-                cls.time == time).first()
+        model = cls._model()
+        with session_scope(readonly=True) as session:
+            candle = cls._query(session).filter(
+                model.time == time).first()
         if candle is None:
             return None
         return candle
 
-    def save(self):
-        with session_scope() as session:
-            session.add(self)
+    @classmethod
+    def upsert(cls, time, open, close, high, low, volume):
+        candle = cls._build(time=time,
+                            open=open,
+                            close=close,
+                            high=high,
+                            low=low,
+                            volume=volume)
+        with session_scope(table=cls._model().__table__) as session:
+            session.merge(candle)
+        return candle
 
     @classmethod
     def get_all_candles(cls, limit=100):
-        with session_scope() as session:
-            candles = session.query(cls).order_by(
-                desc(cls.time)).limit(limit).all()
+        model = cls._model()
+        with session_scope(readonly=True) as session:
+            candles = cls._query(session).order_by(
+                desc(model.time)).limit(limit).all()
 
         if candles is None:
             return None
@@ -68,34 +117,78 @@ class BaseCandleMixin(object):
         return candles
 
     @classmethod
-    def get_fraction_candle(cls, product_code=settings.product_code):
-        recent_time = cls.get_all_candles(limit=1)[0].time
-        with session_scope() as session:
-            table = factory_candle_class(
-                product_code=product_code, duration=constants.DURATION_5S)
-            candles = session.query(table).filter(
-                table.time >= recent_time).order_by(desc(table.time)).all()
+    def get_candle_arrays(cls, limit=100):
+        """Same candles as ``get_all_candles`` as a ``CandleArrays``."""
+        model = cls._model()
+        with session_scope(readonly=True) as session:
+            rows = session.execute(cls._select().order_by(
+                desc(model.time)).limit(limit)).fetchall()
 
-        if candles is None:
+        rows.reverse()
+        return CandleArrays.from_rows(rows)
+
+    @classmethod
+    def get_candles_between(cls, start=None, end=None, chunk_size=10000):
+        """Yield the candles with ``start <= time < end`` as ``CandleArrays`` blocks.
+
+        Rows are streamed from a server-side cursor ``chunk_size`` at a time,
+        so memory stays bounded whatever the size of the range. The cursor
+        runs on the connection of a read scope held until the last block;
+        scopes the consumer opens in between are nested in it and must not
+        write.
+        """
+        model = cls._model()
+        query = cls._select().order_by(asc(model.time))
+        if start is not None:
+            query = query.where(model.time >= start)
+        if end is not None:
+            query = query.where(model.time < end)
+        with session_scope(readonly=True) as session:
+            result = session.connection().execution_options(stream_results=True).execute(query)
+            try:
+                while True:
+                    rows = result.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield CandleArrays.from_rows(rows)
+            finally:
+                result.close()
+
+    @classmethod
+    def get_fraction_candle(cls, product_code=settings.product_code):
+        """Partial candle made of the 5S candles since the latest candle of this duration.
+
+        High, low, volume and the first open / last close are computed by
+        the database in a single aggregate query.
+        """
+        model = cls._model()
+        recent_time = select([func.max(model.time)]).where(
+            and_(*cls._criteria())).correlate(None).as_scalar()
+
+        table = factory_candle_class(
+            product_code=product_code, duration=constants.DURATION_5S)
+        base = table._model()
+        criteria = table._criteria() + [base.time >= recent_time]
+        open = select([base.open]).where(and_(*criteria)).order_by(
+            asc(base.time)).limit(1).correlate(None).as_scalar()
+        close = select([base.close]).where(and_(*criteria)).order_by(
+            desc(base.time)).limit(1).correlate(None).as_scalar()
+        query = select([func.max(base.time), open, close, func.max(base.high),
+                        func.min(base.low), func.sum(base.volume)]).where(and_(*criteria))
+
+        with session_scope(readonly=True) as session:
+            row = session.execute(query).first()
+
+        if row is None or row[0] is None:
             return None
 
-        time = candles[0].time
-        high = candles[0].high
-        low = candles[0].low
-        close = candles[0].close
-        open = candles[-1].open
-        volume = 0
-        for i in range(len(candles)):
-            high = max(candles[i].high, high)
-            low = min(candles[i].low, low)
-            volume += candles[i].volume
-
-        candle = cls(time=time,
-                     open=open,
-                     close=close,
-                     high=high,
-                     low=low,
-                     volume=volume)
+        time, open, close, high, low, volume = row
+        candle = cls._build(time=time,
+                            open=open,
+                            close=close,
+                            high=high,
+                            low=low,
+                            volume=int(volume))
         return candle
 
     # @classmethod
@@ -108,6 +201,19 @@ class BaseCandleMixin(object):
     #
     #     return true_range
 
+
+class BaseCandleMixin(CandleQueryMixin):
+    time = Column(DateTime, primary_key=True, nullable=False)
+    open = Column(Float)
+    close = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    volume = Column(Integer)
+
+    def save(self):
+        with session_scope(table=self.__table__) as session:
+            session.add(self)
+
     @property
     def value(self):
         return {
@@ -316,134 +422,87 @@ class FxBtcJpyBaseCandle5S(BaseCandleMixin, Base):
     __tablename__ = 'FX_BTC_JPY_5S'
 
 
+class Candle(BaseCandleMixin, Base):
+    """Candles of every product and duration in a single table.
+
+    Used when ``settings.candle_storage`` is ``unified``. Callers reach it
+    through ``factory_candle_class``, which returns a UnifiedCandleScope
+    bound to one product/duration.
+    """
+    __tablename__ = 'candle'
+    __table_args__ = (PrimaryKeyConstraint('product_code', 'duration', 'time'),)
+
+    product_code = Column(String(20), nullable=False)
+    duration = Column(String(8), nullable=False)
+    time = Column(DateTime, nullable=False)
+
+    @classmethod
+    def get_candles_for(cls, product_codes, durations, start=None, end=None):
+        """Read several products/durations in one query.
+
+        Returns a dict of (product_code, duration) to candles in time order.
+        """
+        with session_scope(readonly=True) as session:
+            query = session.query(cls).filter(
+                cls.product_code.in_(product_codes), cls.duration.in_(durations))
+            if start is not None:
+                query = query.filter(cls.time >= start)
+            if end is not None:
+                query = query.filter(cls.time < end)
+            rows = query.order_by(cls.product_code, cls.duration, cls.time).all()
+
+        candles = {}
+        for row in rows:
+            candles.setdefault((row.product_code, row.duration), []).append(row)
+        return candles
+
+
+class UnifiedCandleScope(CandleQueryMixin):
+    """Per-table candle class API backed by the unified ``candle`` table."""
+    product_code = None
+    duration = None
+
+    @classmethod
+    def _model(cls):
+        return Candle
+
+    @classmethod
+    def _criteria(cls):
+        return [Candle.product_code == cls.product_code, Candle.duration == cls.duration]
+
+    @classmethod
+    def _row(cls, **values):
+        values['product_code'] = cls.product_code
+        values['duration'] = cls.duration
+        return values
+
+
+_unified_candle_classes = {}
+
+
+def unified_candle_class(product_code, duration):
+    key = (product_code, duration)
+    cls = _unified_candle_classes.get(key)
+    if cls is None:
+        name = product_code.title().replace('_', '') + 'UnifiedCandle' + duration.upper()
+        cls = type(name, (UnifiedCandleScope,), {
+            '__tablename__': Candle.__tablename__,
+            'product_code': product_code,
+            'duration': duration,
+        })
+        _unified_candle_classes[key] = cls
+    return cls
+
+
+_candle_classes = {cls.__tablename__: cls for cls in BaseCandleMixin.__subclasses__()
+                   if cls is not Candle}
+
+
+def per_table_candle_class(product_code, duration):
+    return _candle_classes.get(f'{product_code}_{duration.upper()}')
+
+
 def factory_candle_class(product_code, duration):
-    if product_code == constants.PRODUCT_CODE_USD_JPY:
-        if duration == constants.DURATION_5S:
-            return UsdJpyBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return UsdJpyBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return UsdJpyBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return UsdJpyBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return UsdJpyBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return UsdJpyBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return UsdJpyBaseCandle1D
-
-    if product_code == constants.PRODUCT_CODE_EUR_JPY:
-        if duration == constants.DURATION_5S:
-            return EurJpyBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return EurJpyBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return EurJpyBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return EurJpyBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return EurJpyBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return EurJpyBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return EurJpyBaseCandle1D
-
-    if product_code == constants.PRODUCT_CODE_EUR_USD:
-        if duration == constants.DURATION_5S:
-            return EurUsdBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return EurUsdBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return EurUsdBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return EurUsdBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return EurUsdBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return EurUsdBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return EurUsdBaseCandle1D
-
-    if product_code == constants.PRODUCT_CODE_GBP_JPY:
-        if duration == constants.DURATION_5S:
-            return GbpJpyBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return GbpJpyBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return GbpJpyBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return GbpJpyBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return GbpJpyBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return GbpJpyBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return GbpJpyBaseCandle1D
-
-    if product_code == constants.PRODUCT_CODE_GBP_USD:
-        if duration == constants.DURATION_5S:
-            return GbpUsdBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return GbpUsdBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return GbpUsdBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return GbpUsdBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return GbpUsdBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return GbpUsdBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return GbpUsdBaseCandle1D
-
-    if product_code == constants.PRODUCT_CODE_AUD_JPY:
-        if duration == constants.DURATION_5S:
-            return AudJpyBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return AudJpyBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return AudJpyBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return AudJpyBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return AudJpyBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return AudJpyBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return AudJpyBaseCandle1D
-
-    if product_code == constants.PRODUCT_CODE_FX_BTC_JPY:
-        if duration == constants.DURATION_5S:
-            return FxBtcJpyBaseCandle5S
-        if duration == constants.DURATION_1M:
-            return FxBtcJpyBaseCandle1M
-        if duration == constants.DURATION_5M:
-            return FxBtcJpyBaseCandle5M
-        if duration == constants.DURATION_15M:
-            return FxBtcJpyBaseCandle15M
-        if duration == constants.DURATION_30M:
-            return FxBtcJpyBaseCandle30M
-        if duration == constants.DURATION_1H:
-            return FxBtcJpyBaseCandle1H
-        if duration == constants.DURATION_1D:
-            return FxBtcJpyBaseCandle1D
-
-
-def create_candle_with_duration(product_code, duration, ticker):
-    cls = factory_candle_class(product_code, duration)
-    ticker_time = ticker.truncate_date_time(duration)
-    current_candle = cls.get(ticker_time)
-    price = ticker.mid_price
-    if current_candle is None:
-        cls.create(ticker_time, price, price, price, price, ticker.volume)
-        return True
-
-    if current_candle.high <= price:
-        current_candle.high = price
-    elif current_candle.low >= price:
-        current_candle.low = price
-    current_candle.volume += ticker.volume
-    current_candle.close = price
-    current_candle.save()
-    return False
+    if settings.candle_storage == constants.CANDLE_STORAGE_UNIFIED:
+        return unified_candle_class(product_code, duration)
+    return per_table_candle_class(product_code, duration)
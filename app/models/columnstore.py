@@ -0,0 +1,169 @@
+from argparse import ArgumentParser
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from app.models.arrays import CandleArrays
+from app.models.candle import factory_candle_class
+
+import constants
+import settings
+
+logger = logging.getLogger(__name__)
+
+COLUMN_DTYPES = {
+    'time': np.dtype('<i8'),
+    'open': np.dtype('<f8'),
+    'close': np.dtype('<f8'),
+    'high': np.dtype('<f8'),
+    'low': np.dtype('<f8'),
+    'volume': np.dtype('<f8'),
+}
+
+
+def to_epoch_seconds(value):
+    """Epoch seconds (int) of a naive UTC datetime, datetime64 or number."""
+    if isinstance(value, (int, float, np.integer)):
+        return int(value)
+    return int(np.datetime64(value, 's').astype(np.int64))
+
+
+class ColumnStore(object):
+    """Append-only candle store with one memory-mapped file per column.
+
+    Each product/duration lives in ``<directory>/<product_code>/<duration>/``
+    with ``time`` as int64 epoch seconds and the other columns as float64,
+    all in time order. Reads binary search the time column and return
+    ``CandleArrays`` whose columns are views of the mapped files.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = settings.column_store_dir
+        self.directory = directory
+
+    def path(self, product_code, duration, column=None):
+        path = os.path.join(self.directory, product_code, duration)
+        if column is None:
+            return path
+        return os.path.join(path, f'{column}.bin')
+
+    def count(self, product_code, duration):
+        """Rows fully written to every column, ignoring a torn append."""
+        counts = []
+        for column, dtype in COLUMN_DTYPES.items():
+            path = self.path(product_code, duration, column)
+            if not os.path.exists(path):
+                return 0
+            counts.append(os.path.getsize(path) // dtype.itemsize)
+        return min(counts)
+
+    def _map(self, product_code, duration, column, count):
+        if count == 0:
+            return np.empty(0, dtype=COLUMN_DTYPES[column])
+        return np.memmap(self.path(product_code, duration, column),
+                         dtype=COLUMN_DTYPES[column], mode='r', shape=(count,))
+
+    def last_time(self, product_code, duration):
+        """Epoch seconds of the last stored candle, or None."""
+        count = self.count(product_code, duration)
+        if count == 0:
+            return None
+        return int(self._map(product_code, duration, 'time', count)[-1])
+
+    def append(self, product_code, duration, candles: CandleArrays):
+        """Append candles newer than the last stored one and return how many."""
+        times = candles.time.astype('datetime64[s]').astype(np.int64)
+        if len(times) > 1 and np.any(np.diff(times) <= 0):
+            raise ValueError('candles must be in strictly increasing time order')
+        last = self.last_time(product_code, duration)
+        start = 0 if last is None else int(np.searchsorted(times, last, side='right'))
+        if start >= len(times):
+            return 0
+
+        os.makedirs(self.path(product_code, duration), exist_ok=True)
+        count = self.count(product_code, duration)
+        # The time column is written last so a torn append is ignored by count().
+        for column in ['open', 'close', 'high', 'low', 'volume', 'time']:
+            values = times if column == 'time' else getattr(candles, column)
+            path = self.path(product_code, duration, column)
+            with open(path, mode='r+b' if os.path.exists(path) else 'wb') as f:
+                f.seek(count * COLUMN_DTYPES[column].itemsize)
+                f.truncate()
+                f.write(np.ascontiguousarray(values[start:], dtype=COLUMN_DTYPES[column]).tobytes())
+        return len(times) - start
+
+    def read(self, product_code, duration, start=None, end=None):
+        """Candles with ``start <= time < end`` as views of the mapped files.
+
+        ``start`` and ``end`` are naive UTC datetimes, datetime64 or epoch
+        seconds; None leaves that side open.
+        """
+        count = self.count(product_code, duration)
+        times = self._map(product_code, duration, 'time', count)
+        lo = 0 if start is None else int(np.searchsorted(times, to_epoch_seconds(start), side='left'))
+        hi = count if end is None else int(np.searchsorted(times, to_epoch_seconds(end), side='left'))
+        hi = max(lo, hi)
+        columns = {column: self._map(product_code, duration, column, count)[lo:hi]
+                   for column in COLUMN_DTYPES}
+        return CandleArrays(columns['time'].view('datetime64[s]'), columns['open'],
+                            columns['close'], columns['high'], columns['low'],
+                            columns['volume'])
+
+    def tail(self, product_code, duration, limit):
+        """The last ``limit`` candles, like ``get_all_candles``."""
+        count = self.count(product_code, duration)
+        candles = self.read(product_code, duration)
+        return candles[max(0, count - limit):]
+
+
+def export_from_sql(store, product_codes=None, durations=None, chunk_size=100000):
+    """Append the SQL candles newer than what the store holds.
+
+    Rows are streamed in time order and appended block by block, so the
+    export can be interrupted and resumed. Returns the appended row counts.
+    """
+    if product_codes is None:
+        product_codes = settings.product_codes.split(',')
+    if durations is None:
+        durations = constants.DURATIONS
+
+    exported = {}
+    for product_code in product_codes:
+        for duration in durations:
+            cls = factory_candle_class(product_code, duration)
+            if cls is None:
+                continue
+            last = store.last_time(product_code, duration)
+            if last is not None:
+                last = np.datetime64(last, 's').astype(object)
+            start = time.perf_counter()
+            total = 0
+            for candles in cls.get_candles_between(start=last, chunk_size=chunk_size):
+                total += store.append(product_code, duration, candles)
+            exported[(product_code, duration)] = total
+            logger.info(f'action=export_from_sql product_code={product_code} duration={duration} '
+                        f'rows={total} elapsed={time.perf_counter() - start:.2f}')
+    return exported
+
+
+def main():
+    parser = ArgumentParser(description='Export SQL candles to the column store')
+    parser.add_argument('--directory', default=settings.column_store_dir)
+    parser.add_argument('--product-codes', help='comma separated, default: all')
+    parser.add_argument('--durations', help='comma separated, default: all')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    product_codes = args.product_codes.split(',') if args.product_codes else None
+    durations = args.durations.split(',') if args.durations else None
+    exported = export_from_sql(ColumnStore(args.directory), product_codes, durations, args.chunk_size)
+    logger.info(f'action=export_from_sql status=done rows={sum(exported.values())}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    main()
@@ -1,17 +1,23 @@
+from collections import OrderedDict
+from threading import Lock
+
 from dict2obj import Dict2Obj
 import numpy as np
 import talib
 
+from app.models.arrays import CandleArrays
+from app.models.base import table_version
 from app.models.candle import factory_candle_class
+from app.models.columnstore import ColumnStore
 from app.models.events import SignalEvents
 import settings
-from utils.utils import Serializer
-from tradingalgo.algo import ichimoku_cloud, force_index
+from utils.utils import lazy_property
+from tradingalgo.algo import ichimoku_cloud_arrays, force_index
 
 
 def nan_to_zero(values: np.asarray):
-    values[np.isnan(values)] = 0
-    return values
+    # Returns a copy: values may be read-only arrays shared by the indicator cache.
+    return np.where(np.isnan(values), 0, values)
 
 
 def empty_to_none(input_list):
@@ -20,80 +26,322 @@ def empty_to_none(input_list):
     return input_list
 
 
-class Sma(Serializer):
-    def __init__(self, period: int, values: list):
+def crossed_above(values, other, start=1):
+    """Mask of the indices i >= start where ``values`` crosses ``other`` upwards."""
+    crossed = np.zeros(len(values), dtype=bool)
+    crossed[1:] = (values[:-1] < other[:-1]) & (values[1:] >= other[1:])
+    crossed[:start] = False
+    return crossed
+
+
+def crossed_below(values, other, start=1):
+    """Mask of the indices i >= start where ``values`` crosses ``other`` downwards."""
+    crossed = np.zeros(len(values), dtype=bool)
+    crossed[1:] = (values[:-1] > other[:-1]) & (values[1:] <= other[1:])
+    crossed[:start] = False
+    return crossed
+
+
+def nbytes(values):
+    if isinstance(values, tuple):
+        return sum(nbytes(v) for v in values)
+    return values.nbytes
+
+
+def read_only(values):
+    if isinstance(values, tuple):
+        return tuple(read_only(v) for v in values)
+    values.flags.writeable = False
+    return values
+
+
+INDICATORS = {
+    'SMA': lambda df, period: talib.SMA(df.closes, period),
+    'EMA': lambda df, period: talib.EMA(df.closes, period),
+    'BBANDS': lambda df, n, k: talib.BBANDS(df.closes, n, k, k, 0),
+    'ATR': lambda df, n: talib.ATR(df.highs, df.lows, df.closes, n),
+    'PLUS_DI': lambda df, n: talib.PLUS_DI(df.highs, df.lows, df.closes, n),
+    'MINUS_DI': lambda df, n: talib.MINUS_DI(df.highs, df.lows, df.closes, n),
+    'ADX': lambda df, n: talib.ADX(df.highs, df.lows, df.closes, n),
+    'ADXR': lambda df, n: talib.ADXR(df.highs, df.lows, df.closes, n),
+    'RSI': lambda df, period: talib.RSI(df.closes, period),
+    'MACD': lambda df, fast, slow, signal: talib.MACD(df.closes, fast, slow, signal),
+    'ICHIMOKU': lambda df: ichimoku_cloud_arrays(df.closes),
+}
+
+
+class IndicatorCache(object):
+    """LRU cache of indicator arrays keyed by (data version, indicator, params).
+
+    The arrays held are bounded to ``max_bytes``; an indicator larger than
+    that is computed but not kept. Cached arrays are shared between
+    callers and therefore read-only.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = settings.indicator_cache_bytes
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+        values = read_only(compute())
+        size = nbytes(values)
+        if size > self.max_bytes:
+            return values
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = values, size
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return values
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    @property
+    def value(self):
+        return {
+            'size': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+indicator_cache = IndicatorCache()
+
+
+def candle_version(candles: CandleArrays):
+    """Fingerprint of the candle data, changing whenever any candle changes.
+
+    Hashes every column; only used for candles set directly, the loaders
+    pass a cheap ``window_version``.
+    """
+    return hash((len(candles), candles.time.tobytes(), candles.open.tobytes(),
+                 candles.close.tobytes(), candles.high.tobytes(), candles.low.tobytes(),
+                 candles.volume.tobytes()))
+
+
+def window_version(candles: CandleArrays):
+    """Bounds and last candle of ``candles``: cheap, and enough where only the last candle changes."""
+    if not len(candles):
+        return 0,
+    return (len(candles), candles.time[0], candles.time[-1], candles.open[-1], candles.close[-1],
+            candles.high[-1], candles.low[-1], candles.volume[-1])
+
+
+class LazyIndicator(object):
+    """Indicator of a DataFrameCandle computed on first access of its series.
+
+    Series stay NumPy arrays, NaN included, until the JSON encoding of
+    the response; ``value`` lists ``fields`` in output order.
+    """
+    fields = ()
+
+    def __init__(self, df):
+        self.df = df
+
+    @property
+    def value(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+
+class Sma(LazyIndicator):
+    fields = ('period', 'values')
+
+    def __init__(self, df, period: int):
+        super().__init__(df)
         self.period = period
-        self.values = values
+
+    @lazy_property
+    def values(self):
+        return self.df.indicator('SMA', self.period)
 
 
-class Ema(Serializer):
-    def __init__(self, period: int, values: list):
+class Ema(LazyIndicator):
+    fields = ('period', 'values')
+
+    def __init__(self, df, period: int):
+        super().__init__(df)
         self.period = period
-        self.values = values
+
+    @lazy_property
+    def values(self):
+        return self.df.indicator('EMA', self.period)
 
 
-class BBands(Serializer):
-    def __init__(self, n: int, k: float, up: list, mid: list, down: list):
+class BBands(LazyIndicator):
+    fields = ('n', 'k', 'up', 'mid', 'down')
+
+    def __init__(self, df, n: int, k: float):
+        super().__init__(df)
         self.n = n
         self.k = k
-        self.up = up
-        self.mid = mid
-        self.down = down
+
+    @lazy_property
+    def up(self):
+        return self.df.indicator('BBANDS', self.n, self.k)[0]
+
+    @lazy_property
+    def mid(self):
+        return self.df.indicator('BBANDS', self.n, self.k)[1]
+
+    @lazy_property
+    def down(self):
+        return self.df.indicator('BBANDS', self.n, self.k)[2]
 
 
-class Atr(Serializer):
-    def __init__(self, n: int, k: float, up: list, down: list):
+class Atr(LazyIndicator):
+    fields = ('n', 'k', 'up', 'down')
+
+    def __init__(self, df, n: int, k: float):
+        super().__init__(df)
         self.n = n
         self.k = k
-        self.up = up
-        # self.mid = mid
-        self.down = down
 
+    @lazy_property
+    def band(self):
+        # Zero before the first ATR, so the bands start on the EMA.
+        return nan_to_zero(self.df.indicator('ATR', self.n)) * self.k
+
+    @lazy_property
+    def up(self):
+        return nan_to_zero(self.df.indicator('EMA', self.n)) + self.band
+
+    @lazy_property
+    def down(self):
+        return nan_to_zero(self.df.indicator('EMA', self.n)) - self.band
 
-class Di(Serializer):
-    def __init__(self, n: int, plus_di: list, minus_di: list):
+
+class Di(LazyIndicator):
+    fields = ('n', 'plus_di', 'minus_di')
+
+    def __init__(self, df, n: int):
+        super().__init__(df)
         self.n = n
-        self.plus_di = plus_di
-        self.minus_di = minus_di
+
+    @lazy_property
+    def plus_di(self):
+        return self.df.indicator('PLUS_DI', self.n)
+
+    @lazy_property
+    def minus_di(self):
+        return self.df.indicator('MINUS_DI', self.n)
 
 
-class Adx(Serializer):
-    def __init__(self, n: int, adx: list, adxr: list):
+class Adx(LazyIndicator):
+    fields = ('n', 'adx', 'adxr')
+
+    def __init__(self, df, n: int):
+        super().__init__(df)
         self.n = n
-        self.adx = adx
-        self.adxr = adxr
 
+    @lazy_property
+    def adx(self):
+        return self.df.indicator('ADX', self.n)
+
+    @lazy_property
+    def adxr(self):
+        return self.df.indicator('ADXR', self.n)
+
+
+def zero_padded(values: np.ndarray):
+    """List of ``values`` with the leading 0 padding as int 0, as ichimoku_cloud returns it."""
+    return [0 if value == 0 else value for value in values.tolist()]
+
+
+class IchimokuCloud(LazyIndicator):
+    fields = ('tenkan', 'kijun', 'senkou_a', 'senkou_b', 'chikou')
+
+    @lazy_property
+    def tenkan(self):
+        return zero_padded(self.df.indicator('ICHIMOKU')[0])
+
+    @lazy_property
+    def kijun(self):
+        return zero_padded(self.df.indicator('ICHIMOKU')[1])
+
+    @lazy_property
+    def senkou_a(self):
+        return zero_padded(self.df.indicator('ICHIMOKU')[2])
+
+    @lazy_property
+    def senkou_b(self):
+        return zero_padded(self.df.indicator('ICHIMOKU')[3])
 
-class IchimokuCloud(Serializer):
-    def __init__(self, tenkan: list, kijun: list, senkou_a: list,
-                 senkou_b: list, chikou: list):
-        self.tenkan = tenkan
-        self.kijun = kijun
-        self.senkou_a = senkou_a
-        self.senkou_b = senkou_b
-        self.chikou = chikou
+    @lazy_property
+    def chikou(self):
+        return zero_padded(self.df.indicator('ICHIMOKU')[4])
 
 
-class Rsi(Serializer):
-    def __init__(self, period: int, values: list):
+class Rsi(LazyIndicator):
+    fields = ('period', 'values')
+
+    def __init__(self, df, period: int):
+        super().__init__(df)
         self.period = period
-        self.values = values
+
+    @lazy_property
+    def values(self):
+        return self.df.indicator('RSI', self.period)
 
 
-class Macd(Serializer):
-    def __init__(self, fast_period: int, slow_period: int, signal_period: int, macd: list, macd_signal: list, macd_hist: list):
+class Macd(LazyIndicator):
+    fields = ('fast_period', 'slow_period', 'signal_period', 'macd', 'macd_signal', 'macd_hist')
+
+    def __init__(self, df, fast_period: int, slow_period: int, signal_period: int):
+        super().__init__(df)
         self.fast_period = fast_period
         self.slow_period = slow_period
         self.signal_period = signal_period
-        self.macd = macd
-        self.macd_signal = macd_signal
-        self.macd_hist = macd_hist
 
+    @lazy_property
+    def macd(self):
+        return self.df.indicator('MACD', self.fast_period, self.slow_period, self.signal_period)[0]
+
+    @lazy_property
+    def macd_signal(self):
+        return self.df.indicator('MACD', self.fast_period, self.slow_period, self.signal_period)[1]
 
-class ForceIndex(Serializer):
-    def __init__(self, n: int, force_idx: list):
+    @lazy_property
+    def macd_hist(self):
+        return self.df.indicator('MACD', self.fast_period, self.slow_period, self.signal_period)[2]
+
+
+class ForceIndex(LazyIndicator):
+    fields = ('n', 'force_idx')
+
+    def __init__(self, df, n: int):
+        super().__init__(df)
         self.n = n
-        self.force_idx = force_idx
+
+    @lazy_property
+    def force_idx(self):
+        return force_index(self.df.closes, self.df.volumes, self.n)
+
+
+def value_of(indicator):
+    return None if indicator is None else indicator.value
 
 
 class DataFrameCandle(object):
@@ -102,198 +350,177 @@ class DataFrameCandle(object):
         self.product_code = product_code
         self.duration = duration
         self.candle_cls = factory_candle_class(self.product_code, self.duration)
-        self.candles = []
+        self.cache = indicator_cache
+        self.candles = CandleArrays.empty()
         self.fraction_candle = None
         self.smas = []
         self.emas = []
-        self.bbands = BBands(0, 0, [], [], [])
-        self.atr = Atr(0, 0, [], [])
-        self.di = Di(0, [], [])
-        self.adx = Adx(0, [], [])
-        self.ichimoku_cloud = IchimokuCloud([], [], [], [], [])
-        self.rsi = Rsi(0, [])
-        self.macd = Macd(0, 0, 0, [], [], [])
+        self.bbands = None
+        self.atr = None
+        self.di = None
+        self.adx = None
+        self.ichimoku_cloud = None
+        self.rsi = None
+        self.macd = None
         self.force_idx = []
         self.events = SignalEvents()
 
+    @property
+    def candles(self):
+        return self._candles
+
+    @candles.setter
+    def candles(self, candles):
+        self.set_candles(candles)
+
+    def set_candles(self, candles, version=None):
+        """Use ``candles``; ``version`` identifies their data, without it they are hashed."""
+        self._candles = candles
+        if version is None:
+            version = candle_version(candles)
+        self.version = (self.product_code, self.duration, version)
+
+    def indicator(self, name, *params):
+        """Indicator ``name`` of INDICATORS over the candles, memoized per data version."""
+        return self.cache.get((self.version, name, params),
+                              lambda: INDICATORS[name](self, *params))
+
     def set_all_candles(self, limit=1000):
-        self.candles = self.candle_cls.get_all_candles(limit)
+        # Stored rows other than the last one change through writes of this
+        # process (late ticks), counted by table_version. Read it first so
+        # that a write during the read gives a new version next time.
+        written = table_version(self.candle_cls._model().__table__)
+        candles = self.candle_cls.get_candle_arrays(limit)
+        self.set_candles(candles, ('sql', written, window_version(candles)))
         self.fraction_candle = self.candle_cls.get_fraction_candle(self.product_code)
         return self.candles
 
+    def set_stored_candles(self, start=None, end=None, store=None):
+        """Use candles of the column store, as views of its mapped files."""
+        if store is None:
+            store = ColumnStore()
+        # The store is append only: a window does not change once written.
+        candles = store.read(self.product_code, self.duration, start, end)
+        self.set_candles(candles, ('store', store.directory, window_version(candles)))
+        return self.candles
+
     def set_recent_candles(self, limit=1000):
         self.set_all_candles(limit)
-        self.candles = self.candles.append(self.fraction_candle)
+        return self.append_fraction_candle()
+
+    def append_fraction_candle(self):
+        if self.fraction_candle is not None:
+            candles = CandleArrays.concatenate(
+                [self.candles, CandleArrays.from_candles([self.fraction_candle])])
+            self.set_candles(candles, (self.version[2], window_version(candles)))
         return self.candles
 
     @property
     def value(self):
+        return self.value_with(self.candles.value)
+
+    @property
+    def columnar_value(self):
+        """``value`` with the candles as one series per column, see CandleArrays.columns."""
+        return self.value_with(self.candles.columns)
+
+    def value_with(self, candles):
         return {
             'product_code': self.product_code,
             'duration': self.duration,
-            'candles': [c.value for c in self.candles],
+            'candles': candles,
             'smas': empty_to_none([s.value for s in self.smas]),
             'emas': empty_to_none([s.value for s in self.emas]),
-            'bbands': self.bbands.value,
-            'atr': self.atr.value,
-            'ichimoku': self.ichimoku_cloud.value,
-            'di': self.di.value,
-            'adx': self.adx.value,
-            'rsi': self.rsi.value,
-            'macd': self.macd.value,
+            'bbands': value_of(self.bbands),
+            'atr': value_of(self.atr),
+            'ichimoku': value_of(self.ichimoku_cloud),
+            'di': value_of(self.di),
+            'adx': value_of(self.adx),
+            'rsi': value_of(self.rsi),
+            'macd': value_of(self.macd),
             'force_idx': empty_to_none([s.value for s in self.force_idx]),
             'events': self.events.value,
         }
 
     @property
     def opens(self):
-        values = []
-        for candle in self.candles:
-            values.append(candle.open)
-        return values
+        return self.candles.open
 
     @property
     def closes(self):
-        values = []
-        for candle in self.candles:
-            values.append(candle.close)
-        return values
+        return self.candles.close
 
     @property
     def highs(self):
-        values = []
-        for candle in self.candles:
-            values.append(candle.high)
-        return values
+        return self.candles.high
 
     @property
     def lows(self):
-        values = []
-        for candle in self.candles:
-            values.append(candle.low)
-        return values
+        return self.candles.low
 
     @property
     def volumes(self):
-        values = []
-        for candle in self.candles:
-            values.append(candle.volume)
-        return values
+        return self.candles.volume
 
     def add_sma(self, period: int):
-
         if len(self.closes) > period:
-            values = talib.SMA(np.asarray(self.closes), period)
-            sma = Sma(
-                period,
-                nan_to_zero(values).tolist()
-            )
-            self.smas.append(sma)
+            self.smas.append(Sma(self, period))
             return True
         return False
 
     def add_ema(self, period: int):
-
         if len(self.closes) > period:
-            values = talib.EMA(np.asarray(self.closes), period)
-            ema = Ema(
-                period,
-                nan_to_zero(values).tolist()
-            )
-            self.emas.append(ema)
+            self.emas.append(Ema(self, period))
             return True
         return False
 
     def add_bbands(self, n: int, k: float):
         if n <= len(self.closes):
-            up, mid, down = talib.BBANDS(np.array(self.closes), n, k, k, 0)
-            up_list = nan_to_zero(up).tolist()
-            mid_list = nan_to_zero(mid).tolist()
-            down_list = nan_to_zero(down).tolist()
-            self.bbands = BBands(n, k, up_list, mid_list, down_list)
+            self.bbands = BBands(self, n, k)
             return True
         return False
 
     def add_atr(self, n: int, k: float):
         if n <= len(self.closes):
-            atr = talib.ATR(
-                np.array(self.highs), np.array(self.lows),
-                np.array(self.closes), n)
-            mid_list = nan_to_zero(talib.EMA(np.array(self.closes), n))
-            up_list = (mid_list + nan_to_zero(atr) * k).tolist()
-            down_list = (mid_list - nan_to_zero(atr) * k).tolist()
-            self.atr = Atr(n, k, up_list, down_list)
+            self.atr = Atr(self, n, k)
             return True
         return False
 
     def add_di(self, n: int):
         if n <= len(self.closes):
-            plus_di = nan_to_zero(talib.PLUS_DI(
-                np.array(self.highs), np.array(self.lows),
-                np.array(self.closes), n)).tolist()
-            minus_di = nan_to_zero(talib.MINUS_DI(
-                np.array(self.highs), np.array(self.lows),
-                np.array(self.closes), n)).tolist()
-            self.di = Di(n, plus_di, minus_di)
+            self.di = Di(self, n)
             return True
         return False
 
     def add_adx(self, n: int):
         if n <= len(self.closes):
-            adx = nan_to_zero(talib.ADX(
-                np.array(self.highs), np.array(self.lows),
-                np.array(self.closes), n)).tolist()
-            adxr = nan_to_zero(talib.ADXR(
-                np.array(self.highs), np.array(self.lows),
-                np.array(self.closes), n)).tolist()
-            self.adx = Adx(n, adx, adxr)
+            self.adx = Adx(self, n)
             return True
         return False
 
     def add_ichimoku(self):
         if len(self.closes) >= 9:
-            tenkan, kijun, senkou_a, senkou_b, chikou = ichimoku_cloud(self.closes)
-            self.ichimoku_cloud = IchimokuCloud(
-                tenkan, kijun, senkou_a, senkou_b, chikou)
+            self.ichimoku_cloud = IchimokuCloud(self)
             return True
         return False
 
     def add_rsi(self, period: int):
-
         if len(self.closes) > period:
-            values = talib.RSI(np.asarray(self.closes), period)
-            rsi = Rsi(
-                period,
-                nan_to_zero(values).tolist()
-            )
-            self.rsi = rsi
+            self.rsi = Rsi(self, period)
             return True
         return False
 
     def add_macd(self, fast_period: int, slow_period: int, signal_period: int):
         if len(self.candles) > 1:
-            macd, macd_signal, macd_hist = talib.MACD(
-                np.asarray(self.closes), fast_period, slow_period, signal_period)
-            macd_list = nan_to_zero(macd).tolist()
-            macd_signal_list = nan_to_zero(macd_signal).tolist()
-            macd_hist_list = nan_to_zero(macd_hist).tolist()
-            self.macd = Macd(
-                fast_period, slow_period, signal_period, macd_list, macd_signal_list, macd_hist_list)
+            self.macd = Macd(self, fast_period, slow_period, signal_period)
             return True
         return False
 
     def add_force_index(self, period: int):
         if len(self.closes) > period:
-            values = force_index(self.closes, self.volumes, period)
-            force_idx = ForceIndex(period, values)
-            self.force_idx.append(force_idx)
+            self.force_idx.append(ForceIndex(self, period))
             return True
         return False
-        # if len(self.candles) > period:
-        #     force_idx = force_index(self.closes, self.volumes, period)
-        #     self.force_idx = ForceIndex(period, force_idx)
-        #     return True
-        # return False
 
     def add_events(self, time):
         signal_events = SignalEvents.get_signal_events_after_time(time)
@@ -302,25 +529,29 @@ class DataFrameCandle(object):
             return True
         return False
 
+    def signal_events_at(self, buys, sells):
+        """Replay buy/sell masks in time order, buy before sell on the same candle."""
+        signal_events = SignalEvents()
+        times = self.candles.time
+        closes = self.closes
+        for i in np.flatnonzero(buys | sells):
+            time = times[i].astype(object)
+            price = float(closes[i])
+            if buys[i]:
+                signal_events.buy(product_code=self.product_code, time=time, price=price, units=1.0, save=False)
+            if sells[i]:
+                signal_events.sell(product_code=self.product_code, time=time, price=price, units=1.0, save=False)
+        return signal_events
+
     def back_test_ema(self, period_1: int, period_2: int):
         if len(self.candles) <= period_1 or len(self.candles) <= period_2:
             return None
 
-        signal_events = SignalEvents()
-        ema_value_1 = talib.EMA(np.array(self.closes), period_1)
-        ema_value_2 = talib.EMA(np.array(self.closes), period_2)
-
-        for i in range(1, len(self.candles)):
-            if i < period_1 or i < period_2:
-                continue
-
-            if ema_value_1[i-1] < ema_value_2[i-1] and ema_value_1[i] >= ema_value_2[i]:
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-            if ema_value_1[i-1] > ema_value_2[i-1] and ema_value_1[i] <= ema_value_2[i]:
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-        return signal_events
+        ema_value_1 = self.indicator('EMA', period_1)
+        ema_value_2 = self.indicator('EMA', period_2)
+        start = max(period_1, period_2)
+        return self.signal_events_at(crossed_above(ema_value_1, ema_value_2, start),
+                                     crossed_below(ema_value_1, ema_value_2, start))
 
     def optimize_ema(self):
         performance = 0
@@ -344,20 +575,9 @@ class DataFrameCandle(object):
         if len(self.candles) <= n:
             return None
 
-        signal_events = SignalEvents()
-        bb_up, _, bb_down = talib.BBANDS(np.array(self.closes), n, k, k, 0)
-
-        for i in range(1, len(self.candles)):
-            if i < n:
-                continue
-
-            if bb_down[i-1] > self.candles[i-1].close and bb_down[i] <= self.candles[i].close:
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-            if bb_up[i-1] < self.candles[i-1].close and bb_up[i] >= self.candles[i].close:
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-        return signal_events
+        bb_up, _, bb_down = self.indicator('BBANDS', n, k)
+        return self.signal_events_at(crossed_above(self.closes, bb_down, n),
+                                     crossed_below(self.closes, bb_up, n))
 
     def optimize_bb(self):
         performance = 0
@@ -382,29 +602,29 @@ class DataFrameCandle(object):
             return None
 
         signal_events = SignalEvents()
-        atr = talib.ATR(
-            np.array(self.highs), np.array(self.lows), np.array(self.closes), n)
-        mid_list = nan_to_zero(talib.EMA(np.asarray(self.closes), n))
+        atr = self.indicator('ATR', n)
+        mid_list = nan_to_zero(self.indicator('EMA', n))
         up_list = (mid_list + nan_to_zero(atr) * k_1).tolist()
         down_list = (mid_list - nan_to_zero(atr) * k_1).tolist()
         up_list_2 = (mid_list + nan_to_zero(atr) * k_2).tolist()
         down_list_2 = (mid_list - nan_to_zero(atr) * k_2).tolist()
+        times = self.candles.time
+        closes = self.closes.tolist()
+        highs = self.highs.tolist()
+        lows = self.lows.tolist()
         has_long_position = False
         has_short_position = False
         buy_stop_loss = 0
         sell_stop_loss = 1000000000
 
-        for i in range(1, len(self.candles)):
-            if i < n:
-                continue
-
-            if has_long_position and self.candles[i].low < buy_stop_loss:
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=buy_stop_loss, units=1.0, save=False)
+        for i in range(max(n, 1), len(closes)):
+            if has_long_position and lows[i] < buy_stop_loss:
+                signal_events.sell(product_code=self.product_code, time=times[i].astype(object), price=buy_stop_loss, units=1.0, save=False)
                 has_long_position = False
                 buy_stop_loss = 0
 
-            if has_short_position and self.candles[i].high > sell_stop_loss:
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=sell_stop_loss, units=1.0, save=False)
+            if has_short_position and highs[i] > sell_stop_loss:
+                signal_events.buy(product_code=self.product_code, time=times[i].astype(object), price=sell_stop_loss, units=1.0, save=False)
                 has_short_position = False
                 sell_stop_loss = 1000000000
 
@@ -414,13 +634,13 @@ class DataFrameCandle(object):
             if has_short_position:
                 sell_stop_loss = min(sell_stop_loss, down_list_2[i])
 
-            if up_list[i-1] > self.candles[i-1].close and up_list[i] <= self.candles[i].close:
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
+            if up_list[i-1] > closes[i-1] and up_list[i] <= closes[i]:
+                signal_events.buy(product_code=self.product_code, time=times[i].astype(object), price=closes[i], units=1.0, save=False)
                 has_long_position = True
                 buy_stop_loss = up_list_2[i]
 
-            if down_list[i-1] < self.candles[i-1].close and down_list[i] >= self.candles[i].close:
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
+            if down_list[i-1] < closes[i-1] and down_list[i] >= closes[i]:
+                signal_events.sell(product_code=self.product_code, time=times[i].astype(object), price=closes[i], units=1.0, save=False)
                 has_short_position = True
                 sell_stop_loss = down_list_2[i]
 
@@ -451,25 +671,14 @@ class DataFrameCandle(object):
         if len(self.candles) <= 52:
             return None
 
-        signal_events = SignalEvents()
-        tenkan, kijun, senkou_a, senkou_b, chikou = ichimoku_cloud(self.closes)
-
-        for i in range(1, len(self.candles)):
-            if (chikou[i-1] < self.candles[i-1].high and
-                    chikou[i] >= self.candles[i].high and
-                    senkou_a[i] < self.candles[i].low and
-                    senkou_b[i] < self.candles[i].low and
-                    tenkan[i] > kijun[i]):
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-            if (chikou[i-1] > self.candles[i-1].low and
-                    chikou[i] <= self.candles[i].low and
-                    senkou_a[i] > self.candles[i].high and
-                    senkou_b[i] > self.candles[i].high and
-                    tenkan[i] < kijun[i]):
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-        return signal_events
+        tenkan, kijun, senkou_a, senkou_b, chikou = self.indicator('ICHIMOKU')
+        highs = self.highs
+        lows = self.lows
+        buys = crossed_above(chikou, highs)
+        buys &= (senkou_a < lows) & (senkou_b < lows) & (tenkan > kijun)
+        sells = crossed_below(chikou, lows)
+        sells &= (senkou_a > highs) & (senkou_b > highs) & (tenkan < kijun)
+        return self.signal_events_at(buys, sells)
 
     def optimize_ichimoku(self):
         signal_events = self.back_test_ichimoku()
@@ -481,20 +690,14 @@ class DataFrameCandle(object):
         if len(self.candles) <= period:
             return None
 
-        signal_events = SignalEvents()
-        values = talib.RSI(np.array(self.closes), period)
-
-        for i in range(1, len(self.candles)):
-            if values[i-1] == 0 or values[i-1] == 100:
-                continue
-
-            if values[i-1] < buy_thread and values[i] >= buy_thread:
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-            if values[i-1] > sell_thread and values[i] <= sell_thread:
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-        return signal_events
+        values = self.indicator('RSI', period)
+        # Candles after a saturated RSI (0 or 100) never signal.
+        saturated = np.zeros(len(values), dtype=bool)
+        saturated[1:] = (values[:-1] == 0) | (values[:-1] == 100)
+        threads_buy = np.full(len(values), buy_thread)
+        threads_sell = np.full(len(values), sell_thread)
+        return self.signal_events_at(crossed_above(values, threads_buy) & ~saturated,
+                                     crossed_below(values, threads_sell) & ~saturated)
 
     def optimize_rsi(self):
         performance = 0
@@ -521,17 +724,11 @@ class DataFrameCandle(object):
         if len(self.candles) <= macd_fast_period or len(self.candles) <= macd_slow_period or len(self.candles) <= macd_signal_period:
             return None
 
-        signal_events = SignalEvents()
-        macd, macd_signal, _ = talib.MACD(np.array(self.closes), macd_slow_period, macd_fast_period, macd_signal_period)
-
-        for i in range(1, len(self.candles)):
-            if macd[i] < 0 and macd_signal[i] < 0 and macd[i-1] < macd_signal[i-1] and macd[i] >= macd_signal[i]:
-                signal_events.buy(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-            if macd[i] > 0 and macd_signal[i] > 0 and macd[i-1] > macd_signal[i-1] and macd[i] <= macd_signal[i]:
-                signal_events.sell(product_code=self.product_code, time=self.candles[i].time, price=self.candles[i].close, units=1.0, save=False)
-
-        return signal_events
+        macd, macd_signal, _ = self.indicator('MACD', macd_slow_period, macd_fast_period, macd_signal_period)
+        negative = (macd < 0) & (macd_signal < 0)
+        positive = (macd > 0) & (macd_signal > 0)
+        return self.signal_events_at(crossed_above(macd, macd_signal) & negative,
+                                     crossed_below(macd, macd_signal) & positive)
 
     def optimize_macd(self):
         performance = 0
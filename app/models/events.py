@@ -27,7 +27,7 @@ class SignalEvent(Base):
     units = Column(Integer)
 
     def save(self):
-        with session_scope() as session:
+        with session_scope(table=self.__table__) as session:
             session.add(self)
 
     @property
@@ -45,7 +45,7 @@ class SignalEvent(Base):
 
     @classmethod
     def get_signal_events_by_count(cls, count, prduct_code=settings.product_code):
-        with session_scope() as session:
+        with session_scope(readonly=True) as session:
             rows = session.query(cls).filter(cls.product_code == prduct_code).order_by(desc(cls.time)).limit(count).all()
             if rows is None:
                 return []
@@ -54,7 +54,7 @@ class SignalEvent(Base):
 
     @classmethod
     def get_signal_events_after_time(cls, time):
-        with session_scope() as session:
+        with session_scope(readonly=True) as session:
             rows = session.query(cls).filter(cls.time >= time).all()
 
             if rows is None:
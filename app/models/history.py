@@ -0,0 +1,220 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from app.models.arrays import CANDLE_FIELDS
+from app.models.arrays import CandleArrays
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+from app.models.writer import insert_ignore
+
+import constants
+import settings
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NPZ = 'npz'
+FORMAT_PARQUET = 'parquet'
+FORMATS = [FORMAT_NPZ, FORMAT_PARQUET]
+PART_TIME_FORMAT = '%Y%m%d%H%M%S'
+
+
+def history_dir(directory, product_code, duration):
+    return os.path.join(directory, product_code, duration)
+
+
+def list_parts(directory, product_code, duration):
+    """History files of a product/duration in time order.
+
+    Files are named ``<first time>-<last time>.<format>`` so that the
+    names sort by time and the last exported time needs no file read.
+    """
+    path = history_dir(directory, product_code, duration)
+    if not os.path.isdir(path):
+        return []
+    names = [n for n in os.listdir(path) if os.path.splitext(n)[1][1:] in FORMATS]
+    return [os.path.join(path, n) for n in sorted(names)]
+
+
+def last_exported_time(directory, product_code, duration):
+    parts = list_parts(directory, product_code, duration)
+    if not parts:
+        return None
+    name = os.path.splitext(os.path.basename(parts[-1]))[0]
+    return datetime.strptime(name.split('-')[1], PART_TIME_FORMAT)
+
+
+def write_part(directory, product_code, duration, candles: CandleArrays, format=FORMAT_NPZ):
+    first = candles.time[0].astype(object)
+    last = candles.time[-1].astype(object)
+    path = history_dir(directory, product_code, duration)
+    os.makedirs(path, exist_ok=True)
+    path = os.path.join(path, f'{first:{PART_TIME_FORMAT}}-{last:{PART_TIME_FORMAT}}.{format}')
+    columns = {field: getattr(candles, field) for field in CANDLE_FIELDS}
+    columns['time'] = candles.time.astype('datetime64[s]').astype(np.int64)
+
+    if format == FORMAT_PARQUET:
+        table = pyarrow.table(columns)
+        pyarrow.parquet.write_table(table, path, compression='zstd')
+    else:
+        # Written through a file object so numpy does not append another suffix.
+        with open(path, mode='wb') as f:
+            np.savez_compressed(f, **columns)
+    return path
+
+
+def read_part(path):
+    if path.endswith('.' + FORMAT_PARQUET):
+        table = pyarrow.parquet.read_table(path)
+        columns = {field: table.column(field).to_numpy() for field in CANDLE_FIELDS}
+    else:
+        with np.load(path) as npz:
+            columns = {field: npz[field] for field in CANDLE_FIELDS}
+    columns['time'] = columns['time'].astype('datetime64[s]')
+    return CandleArrays(*[columns[field] for field in CANDLE_FIELDS])
+
+
+def export_table(directory, product_code, duration, start=None, end=None,
+                 format=FORMAT_NPZ, part_rows=1000000, incremental=True):
+    """Export one product/duration, one file per ``part_rows`` candles.
+
+    With ``incremental`` only the candles after the last exported file
+    are written. Returns the number of exported candles.
+    """
+    cls = factory_candle_class(product_code, duration)
+    if cls is None:
+        return 0
+    last = last_exported_time(directory, product_code, duration) if incremental else None
+    if last is not None and (start is None or start <= last):
+        start = last
+
+    blocks = []
+    pending = 0
+    exported = 0
+    for candles in cls.get_candles_between(start, end):
+        if last is not None:
+            candles = candles[int(np.searchsorted(candles.time, np.datetime64(last, 's'), side='right')):]
+        if not len(candles):
+            continue
+        blocks.append(candles)
+        pending += len(candles)
+        if pending >= part_rows:
+            write_part(directory, product_code, duration, CandleArrays.concatenate(blocks), format)
+            exported += pending
+            blocks, pending = [], 0
+    if pending:
+        write_part(directory, product_code, duration, CandleArrays.concatenate(blocks), format)
+        exported += pending
+    return exported
+
+
+def import_table(directory, product_code, duration, start=None, end=None, batch_size=10000):
+    """Bulk insert the exported candles of one product/duration.
+
+    Candles already in the database are left untouched, so an import can
+    be repeated after new files arrive. Returns the number of candles read.
+    """
+    cls = factory_candle_class(product_code, duration)
+    if cls is None:
+        return 0
+    table = cls._model().__table__
+    imported = 0
+    for path in list_parts(directory, product_code, duration):
+        candles = read_part(path)
+        if start is not None:
+            candles = candles[int(np.searchsorted(candles.time, np.datetime64(start, 's'), side='left')):]
+        if end is not None:
+            candles = candles[:int(np.searchsorted(candles.time, np.datetime64(end, 's'), side='left'))]
+        for i in range(0, len(candles), batch_size):
+            block = candles[i:i + batch_size]
+            rows = [cls._row(time=t, open=o, close=c, high=h, low=l, volume=int(v))
+                    for t, o, c, h, l, v in zip(block.time.astype(object).tolist(),
+                                                block.open.tolist(), block.close.tolist(),
+                                                block.high.tolist(), block.low.tolist(),
+                                                block.volume.tolist())]
+            with session_scope(table=table) as session:
+                session.execute(insert_ignore(session, table), rows)
+            imported += len(rows)
+    return imported
+
+
+def _run(func, directory, product_codes, durations, workers, **kwargs):
+    if product_codes is None:
+        product_codes = settings.product_codes.split(',')
+    if durations is None:
+        durations = constants.DURATIONS
+    keys = [(product_code, duration) for product_code in product_codes for duration in durations]
+
+    def run(key):
+        start = time.perf_counter()
+        try:
+            count = func(directory, *key, **kwargs)
+        except Exception as e:
+            logger.error(f'action={func.__name__} key={key} error={e}')
+            raise
+        logger.info(f'action={func.__name__} product_code={key[0]} duration={key[1]} '
+                    f'rows={count} elapsed={time.perf_counter() - start:.2f}')
+        return count
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(keys, executor.map(run, keys)))
+
+
+def export_history(directory, product_codes=None, durations=None, start=None, end=None,
+                   format=FORMAT_NPZ, workers=4, incremental=True):
+    """Export candle tables to compressed columnar files, one table per worker."""
+    if format == FORMAT_PARQUET and pyarrow is None:
+        raise RuntimeError('parquet export needs pyarrow')
+    return _run(export_table, directory, product_codes, durations, workers,
+                start=start, end=end, format=format, incremental=incremental)
+
+
+def import_history(directory, product_codes=None, durations=None, start=None, end=None, workers=4):
+    """Load exported files back into the candle tables, one table per worker."""
+    return _run(import_table, directory, product_codes, durations, workers, start=start, end=end)
+
+
+def parse_time(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S') if 'T' in value \
+        else datetime.strptime(value, '%Y-%m-%d')
+
+
+def main():
+    parser = ArgumentParser(description='Export or import candle history as compressed columnar files')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('--directory', default='history')
+    parser.add_argument('--product-codes', help='comma separated, default: all')
+    parser.add_argument('--durations', help='comma separated, default: all')
+    parser.add_argument('--start', type=parse_time, help='UTC, YYYY-MM-DD[THH:MM:SS]')
+    parser.add_argument('--end', type=parse_time, help='UTC, YYYY-MM-DD[THH:MM:SS], exclusive')
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_NPZ)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--full', action='store_true', help='export everything, not only new candles')
+    args = parser.parse_args()
+
+    product_codes = args.product_codes.split(',') if args.product_codes else None
+    durations = args.durations.split(',') if args.durations else None
+    if args.command == 'export':
+        counts = export_history(args.directory, product_codes, durations, args.start, args.end,
+                                args.format, args.workers, incremental=not args.full)
+    else:
+        counts = import_history(args.directory, product_codes, durations, args.start, args.end,
+                                args.workers)
+    logger.info(f'action={args.command}_history status=done rows={sum(counts.values())}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    main()
@@ -0,0 +1,154 @@
+from datetime import datetime
+from datetime import timezone
+import logging
+import os
+import struct
+from threading import Lock
+import time
+
+import numpy as np
+
+from platforms.base import truncate_timestamps
+
+import constants
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 60 * 60 * 24
+
+TICK_RECORD = struct.Struct('<ddddH')
+TICK_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+    ('volume', '<f8'),
+    ('product_id', '<u2'),
+])
+
+
+def journal_path(directory, day):
+    """Path of the journal file holding the ticks of epoch day ``day``."""
+    date = datetime.fromtimestamp(day * SECONDS_PER_DAY, tz=timezone.utc)
+    return os.path.join(directory, f'ticks-{date:%Y%m%d}.bin')
+
+
+def to_epoch(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class TickJournal(object):
+    """Append-only journal of every ticker, one fixed-size record per tick.
+
+    Records are written to one file per UTC day, in arrival order, so each
+    file can be memory-mapped as an array of ``TICK_DTYPE``. Buffered
+    records are flushed to the file at most ``flush_interval`` seconds
+    after they are appended.
+    """
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.day = None
+        self.file = None
+        self.lock = Lock()
+        self.count = 0
+        self.last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, ticker):
+        product_id = constants.PRODUCT_IDS.get(ticker.product_code)
+        if product_id is None:
+            raise ValueError(f'no journal product id for {ticker.product_code}')
+        record = TICK_RECORD.pack(ticker.timestamp, ticker.bid, ticker.ask,
+                                  ticker.volume, product_id)
+        day = int(ticker.timestamp // SECONDS_PER_DAY)
+        with self.lock:
+            if day != self.day:
+                self._rotate(day)
+            self.file.write(record)
+            self.count += 1
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+
+    def _rotate(self, day):
+        if self.file is not None:
+            self.file.close()
+        self.day = day
+        self.file = open(journal_path(self.directory, day), mode='ab')
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.day = None
+
+
+def open_journal(path):
+    """Memory-map a journal file, ignoring a partially written last record."""
+    count = os.path.getsize(path) // TICK_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=TICK_DTYPE)
+    return np.memmap(path, dtype=TICK_DTYPE, mode='r', shape=(count,))
+
+
+def read_ticks(directory, start, end, product_code=None):
+    """Return the journaled ticks with ``start <= timestamp < end``.
+
+    ``start`` and ``end`` are epoch seconds or UTC datetimes. Ticks are
+    returned in arrival order. Files in time order are binary searched;
+    a file holding late ticks is filtered with a mask instead. A range
+    inside a single time-ordered day without a product filter is returned
+    as a view of the memory-mapped file; otherwise the ticks are copied.
+    """
+    start = to_epoch(start)
+    end = to_epoch(end)
+    blocks = []
+    first_day, last_day = truncate_timestamps([start, end], constants.DURATION_1D) // SECONDS_PER_DAY
+    for day in range(int(first_day), int(last_day) + 1):
+        path = journal_path(directory, day)
+        if not os.path.exists(path):
+            continue
+        ticks = open_journal(path)
+        timestamps = ticks['timestamp']
+        if np.all(timestamps[1:] >= timestamps[:-1]):
+            lo = np.searchsorted(timestamps, start, side='left')
+            hi = np.searchsorted(timestamps, end, side='left')
+            if hi > lo:
+                blocks.append(ticks[lo:hi])
+        else:
+            block = ticks[(timestamps >= start) & (timestamps < end)]
+            if len(block):
+                blocks.append(block)
+
+    if product_code is not None:
+        product_id = constants.PRODUCT_IDS[product_code]
+        blocks = [block[block['product_id'] == product_id] for block in blocks]
+
+    if not blocks:
+        return np.empty(0, dtype=TICK_DTYPE)
+    if len(blocks) == 1:
+        return blocks[0]
+    return np.concatenate(blocks)
+
+
+def last_timestamp(directory):
+    """Timestamp of the most recent journaled tick, or None."""
+    if not os.path.isdir(directory):
+        return None
+    names = sorted(n for n in os.listdir(directory) if n.startswith('ticks-') and n.endswith('.bin'))
+    for name in reversed(names):
+        ticks = open_journal(os.path.join(directory, name))
+        if len(ticks):
+            return float(ticks['timestamp'][-1])
+    return None
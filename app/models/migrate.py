@@ -0,0 +1,65 @@
+from argparse import ArgumentParser
+import logging
+import sys
+import time
+
+from sqlalchemy import literal
+from sqlalchemy import select
+
+from app.models.base import session_scope
+from app.models.candle import Candle
+from app.models.candle import per_table_candle_class
+from app.models.writer import insert_ignore
+
+import constants
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['product_code', 'duration', 'time', 'open', 'close', 'high', 'low', 'volume']
+
+
+def migrate_to_unified(product_codes=None, durations=None):
+    """Copy the per-table candles into the unified ``candle`` table.
+
+    Each table is copied with a single INSERT ... SELECT, skipping rows that
+    already exist, so the migration can be re-run after new candles arrive.
+    Returns the number of rows inserted per (product_code, duration).
+    """
+    if product_codes is None:
+        product_codes = list(constants.PRODUCT_IDS.keys())
+    if durations is None:
+        durations = constants.DURATIONS
+
+    inserted = {}
+    for product_code in product_codes:
+        for duration in durations:
+            source = per_table_candle_class(product_code, duration)
+            if source is None:
+                continue
+            start = time.perf_counter()
+            rows = select([literal(product_code), literal(duration), source.time, source.open,
+                           source.close, source.high, source.low, source.volume])
+            with session_scope(table=Candle.__table__) as session:
+                stmt = insert_ignore(session, Candle.__table__).from_select(COLUMNS, rows)
+                result = session.execute(stmt)
+            inserted[(product_code, duration)] = result.rowcount
+            logger.info(f'action=migrate_to_unified table={source.__tablename__} '
+                        f'rows={result.rowcount} elapsed={time.perf_counter() - start:.2f}')
+    return inserted
+
+
+def main():
+    parser = ArgumentParser(description='Copy per-table candles into the unified candle table')
+    parser.add_argument('--product-codes', help='comma separated, default: all')
+    parser.add_argument('--durations', help='comma separated, default: all')
+    args = parser.parse_args()
+
+    product_codes = args.product_codes.split(',') if args.product_codes else None
+    durations = args.durations.split(',') if args.durations else None
+    inserted = migrate_to_unified(product_codes, durations)
+    logger.info(f'action=migrate_to_unified status=done rows={sum(inserted.values())}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    main()
@@ -0,0 +1,176 @@
+from argparse import ArgumentParser
+from datetime import datetime
+from datetime import timedelta
+import logging
+import sys
+from threading import Event
+from threading import Thread
+import time
+
+import numpy as np
+from sqlalchemy import and_
+
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+from app.models.history import write_part
+from platforms.base import truncate_timestamps
+
+import constants
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+def missing_rollups(product_code, candles, durations=None):
+    """Durations whose candles do not cover every bucket of the 5S ``candles``."""
+    if durations is None:
+        durations = constants.DURATIONS[1:]
+    timestamps = candles.time.astype('datetime64[s]').astype(np.int64)
+    missing = []
+    for duration in durations:
+        seconds = constants.DURATION_SECONDS[duration]
+        buckets = np.unique(truncate_timestamps(timestamps, duration))
+        cls = factory_candle_class(product_code, duration)
+        start = np.datetime64(int(buckets[0]), 's').astype(object)
+        end = np.datetime64(int(buckets[-1]) + seconds, 's').astype(object)
+        stored = [block.time.astype(np.int64) for block in cls.get_candles_between(start, end)]
+        stored = np.concatenate(stored) if stored else np.empty(0, dtype=np.int64)
+        if not np.isin(buckets, stored).all():
+            missing.append(duration)
+    return missing
+
+
+def first_block(blocks):
+    try:
+        return next(blocks, None)
+    finally:
+        blocks.close()
+
+
+class RetentionReport(object):
+    def __init__(self, product_code):
+        self.product_code = product_code
+        self.rows_pruned = 0
+        self.rows_archived = 0
+        self.windows = 0
+        self.batches = 0
+        self.incomplete_window = None
+        self.elapsed = 0.0
+
+    @property
+    def value(self):
+        return {
+            'product_code': self.product_code,
+            'rows_pruned': self.rows_pruned,
+            'rows_archived': self.rows_archived,
+            'windows': self.windows,
+            'batches': self.batches,
+            'incomplete_window': self.incomplete_window,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+def compact(product_code, horizon_days=None, batch_size=None, archive_dir=None,
+            window=timedelta(hours=1), now=None):
+    """Delete the 5S candles of ``product_code`` older than the horizon.
+
+    The 5S rows are walked one ``window`` at a time. A window is only
+    pruned when every coarser duration has a candle for each of its
+    buckets; the first incomplete window stops the run so later rows are
+    kept until the rollup is repaired. Rows are deleted ``batch_size`` at
+    a time, each batch in its own short write transaction. With
+    ``archive_dir`` the pruned candles are first written as history files.
+    """
+    if horizon_days is None:
+        horizon_days = settings.retention_horizon_days
+    if batch_size is None:
+        batch_size = settings.retention_batch_size
+    if archive_dir is None:
+        archive_dir = settings.retention_archive_dir
+    if now is None:
+        now = datetime.utcnow()
+
+    report = RetentionReport(product_code)
+    started = time.perf_counter()
+    cls = factory_candle_class(product_code, constants.DURATION_5S)
+    model = cls._model()
+    table = model.__table__
+    cutoff = (now - timedelta(days=horizon_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    while True:
+        oldest = first_block(cls.get_candles_between(end=cutoff, chunk_size=1))
+        if oldest is None:
+            break
+        start = oldest.time[0].astype(object)
+        end = min(start + window, cutoff)
+        candles = first_block(cls.get_candles_between(start, end, chunk_size=1000000))
+
+        missing = missing_rollups(product_code, candles)
+        if missing:
+            report.incomplete_window = f'{start:%Y-%m-%dT%H:%M:%S}'
+            logger.warning(f'action=compact product_code={product_code} error=incomplete_rollup '
+                           f'window={report.incomplete_window} durations={",".join(missing)}')
+            break
+
+        if archive_dir:
+            write_part(archive_dir, product_code, constants.DURATION_5S, candles)
+            report.rows_archived += len(candles)
+
+        for i in range(0, len(candles), batch_size):
+            first = candles.time[i].astype(object)
+            last = candles.time[min(i + batch_size, len(candles)) - 1].astype(object)
+            with session_scope(table=table) as session:
+                result = session.execute(table.delete().where(
+                    and_(*cls._criteria(), model.time >= first, model.time <= last)))
+            report.rows_pruned += result.rowcount
+            report.batches += 1
+        report.windows += 1
+
+    report.elapsed = time.perf_counter() - started
+    logger.info(f'action=compact {" ".join(f"{k}={v}" for k, v in report.value.items())}')
+    return report
+
+
+class RetentionJob(Thread):
+    """Runs ``compact`` for every product on a fixed interval."""
+
+    def __init__(self, product_codes=None, interval=None):
+        super().__init__(daemon=True)
+        if product_codes is None:
+            product_codes = settings.product_codes.split(',')
+        if interval is None:
+            interval = settings.retention_interval
+        self.product_codes = product_codes
+        self.interval = interval
+        self.stopped = Event()
+        self.reports = {}
+
+    def run(self):
+        while not self.stopped.is_set():
+            for product_code in self.product_codes:
+                try:
+                    self.reports[product_code] = compact(product_code)
+                except Exception as e:
+                    logger.error(f'action=retention_job product_code={product_code} error={e}')
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def main():
+    parser = ArgumentParser(description='Prune 5S candles older than the retention horizon')
+    parser.add_argument('--product-codes', help='comma separated, default: all')
+    parser.add_argument('--horizon-days', type=int, default=settings.retention_horizon_days)
+    parser.add_argument('--batch-size', type=int, default=settings.retention_batch_size)
+    parser.add_argument('--archive-dir', default=settings.retention_archive_dir)
+    args = parser.parse_args()
+
+    product_codes = args.product_codes.split(',') if args.product_codes else settings.product_codes.split(',')
+    for product_code in product_codes:
+        compact(product_code, args.horizon_days, args.batch_size, args.archive_dir)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    main()
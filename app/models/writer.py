@@ -0,0 +1,240 @@
+import atexit
+import logging
+import queue
+from threading import Event
+from threading import Lock
+from threading import Thread
+import time
+
+from sqlalchemy.dialects import mysql
+
+from app.models.base import session_scope
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MAX_VARIABLES = 999
+
+
+def upsert_rows(session, table, rows):
+    """Insert or replace ``rows`` in ``table`` with as few statements as the dialect allows."""
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {c: stmt.inserted[c] for c in rows[0].keys() if not table.c[c].primary_key})
+        session.execute(stmt)
+    elif dialect == 'sqlite':
+        chunk = max(1, SQLITE_MAX_VARIABLES // len(rows[0]))
+        for i in range(0, len(rows), chunk):
+            session.execute(table.insert().prefix_with('OR REPLACE').values(rows[i:i + chunk]))
+    else:
+        for row in rows:
+            primary_key = [row[c.name] for c in table.primary_key.columns]
+            if session.execute(table.select().where(
+                    _primary_key_clause(table, primary_key))).first() is None:
+                session.execute(table.insert().values(row))
+            else:
+                session.execute(table.update().where(
+                    _primary_key_clause(table, primary_key)).values(row))
+
+
+def insert_ignore(session, table):
+    """INSERT statement for ``table`` that skips rows whose key already exists."""
+    dialect = session.get_bind().dialect.name
+    stmt = table.insert()
+    if dialect == 'mysql':
+        return stmt.prefix_with('IGNORE')
+    if dialect == 'sqlite':
+        return stmt.prefix_with('OR IGNORE')
+    return stmt
+
+
+def _primary_key_clause(table, values):
+    clause = None
+    for column, value in zip(table.primary_key.columns, values):
+        expr = column == value
+        clause = expr if clause is None else clause & expr
+    return clause
+
+
+class CandleWriter(object):
+    """Write-behind queue for candle upserts.
+
+    Producers call ``put`` and return immediately. A background thread
+    coalesces the queued rows by (table, time) and flushes them with one
+    multi-row upsert per table once ``batch_size`` rows are pending or
+    ``flush_interval`` seconds have passed. ``stop`` always flushes; rows
+    that still cannot be written then are logged and counted as
+    ``dropped_on_stop``. With ``dry_run`` the batches are built and
+    counted but not written.
+    """
+
+    def __init__(self, max_queue_size=None, batch_size=None, flush_interval=None,
+                 put_timeout=1.0, dry_run=False):
+        if max_queue_size is None:
+            max_queue_size = settings.writer_max_queue_size
+        if batch_size is None:
+            batch_size = settings.writer_batch_size
+        if flush_interval is None:
+            flush_interval = settings.writer_flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.dry_run = dry_run
+        self.pending = {}
+        self.flush_lock = Lock()
+        self.thread = None
+        self.stopped = False
+        self.stop_event = Event()
+        self.metrics_lock = Lock()
+        self.metrics = {
+            'enqueued': 0,
+            'dropped': 0,
+            'dropped_on_stop': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def start(self):
+        if self.thread is not None:
+            return self
+        self.thread = Thread(target=self._run, name='candle-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def put(self, candle_cls, time, open, close, high, low, volume):
+        row = candle_cls._row(time=time, open=open, close=close,
+                              high=high, low=low, volume=volume)
+        try:
+            self.queue.put((candle_cls, row), timeout=self.put_timeout)
+        except queue.Full:
+            self._count('dropped')
+            logger.error(f'action=put error=queue_full table={candle_cls.__tablename__}')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _count(self, name, value=1):
+        with self.metrics_lock:
+            self.metrics[name] += value
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self.stop_event.is_set():
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                self._coalesce(item)
+                self._drain()
+
+            if len(self.pending) >= self.batch_size or \
+                    time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+        self._final_flush()
+
+    def _drain(self):
+        while len(self.pending) < self.batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self._coalesce(item)
+
+    def _coalesce(self, item):
+        if item is _WAKE:
+            return
+        candle_cls, row = item
+        self.pending[(candle_cls, row['time'])] = (candle_cls, row)
+
+    def flush(self):
+        with self.flush_lock:
+            if not self.pending:
+                return 0
+            pending, self.pending = self.pending, {}
+            by_table = {}
+            for candle_cls, row in pending.values():
+                by_table.setdefault(candle_cls._model().__table__, []).append(row)
+
+            start = time.perf_counter()
+            try:
+                if not self.dry_run:
+                    for table, rows in by_table.items():
+                        with session_scope(table=table) as session:
+                            upsert_rows(session, table, rows)
+            except Exception as e:
+                self._count('errors')
+                logger.error(f'action=flush error={e}')
+                for key, value in pending.items():
+                    self.pending.setdefault(key, value)
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self.metrics_lock:
+                self.metrics['flushes'] += 1
+                self.metrics['rows_flushed'] += len(pending)
+                self.metrics['last_flush_ms'] = elapsed_ms
+                self.metrics['total_flush_ms'] += elapsed_ms
+                self.metrics['max_flush_ms'] = max(self.metrics['max_flush_ms'], elapsed_ms)
+            logger.debug(f'action=flush rows={len(pending)} elapsed_ms={elapsed_ms:.2f}')
+            return len(pending)
+
+    def stop(self):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.stop_event.set()
+        if self.thread is not None and self.thread.is_alive():
+            # Wakes the writer thread if it is waiting on an empty queue. A full
+            # queue needs no wake-up, so the marker never blocks.
+            try:
+                self.queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass
+            self.thread.join()
+        else:
+            self._final_flush()
+
+    def _final_flush(self):
+        self._drain_all()
+        self.flush()
+        with self.flush_lock:
+            lost, self.pending = self.pending, {}
+        if not lost:
+            return
+        self._count('dropped_on_stop', len(lost))
+        by_table = {}
+        for candle_cls, row in lost.values():
+            by_table.setdefault(candle_cls._model().__tablename__, []).append(row['time'])
+        for table, times in by_table.items():
+            logger.error(f'action=stop error=rows_not_flushed table={table} rows={len(times)} '
+                         f'first={min(times)} last={max(times)}')
+
+    def _drain_all(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self._coalesce(item)
+
+
+_WAKE = object()
@@ -8,6 +8,16 @@ DURATION_1D = '1d'
 DURATIONS = [DURATION_5S, DURATION_1M, DURATION_5M, DURATION_15M,
              DURATION_30M, DURATION_1H, DURATION_1D]
 
+DURATION_SECONDS = {
+    DURATION_5S: 5,
+    DURATION_1M: 60,
+    DURATION_5M: 60 * 5,
+    DURATION_15M: 60 * 15,
+    DURATION_30M: 60 * 30,
+    DURATION_1H: 60 * 60,
+    DURATION_1D: 60 * 60 * 24,
+}
+
 GRANULARITY_5S = 'S5'
 GRANULARITY_1M = 'M1'
 GRANULARITY_5M = 'M5'
@@ -47,6 +57,9 @@ TRADE_MAP = {
     }
 }
 
+CANDLE_STORAGE_PER_TABLE = 'per_table'
+CANDLE_STORAGE_UNIFIED = 'unified'
+
 BUY = 'BUY'
 SELL = 'SELL'
 
@@ -58,6 +71,18 @@ PRODUCT_CODE_GBP_JPY = 'GBP_JPY'
 PRODUCT_CODE_AUD_JPY = 'AUD_JPY'
 PRODUCT_CODE_FX_BTC_JPY = 'FX_BTC_JPY'
 
+# Stable numeric ids used in binary tick journals. Never renumber.
+PRODUCT_IDS = {
+    PRODUCT_CODE_USD_JPY: 1,
+    PRODUCT_CODE_EUR_JPY: 2,
+    PRODUCT_CODE_EUR_USD: 3,
+    PRODUCT_CODE_GBP_USD: 4,
+    PRODUCT_CODE_GBP_JPY: 5,
+    PRODUCT_CODE_AUD_JPY: 6,
+    PRODUCT_CODE_FX_BTC_JPY: 7,
+}
+PRODUCT_CODES_BY_ID = {product_id: product_code for product_code, product_id in PRODUCT_IDS.items()}
+
 MIN_TRADE_SIZE_MAP = {
     PRODUCT_CODE_USD_JPY: 1000,
     PRODUCT_CODE_EUR_JPY: 1000,
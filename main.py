@@ -4,6 +4,7 @@ from threading import Thread
 
 from app.controllers.streamdata import StreamData
 from app.controllers.webserver import start
+from app.models.retention import RetentionJob
 import settings
 
 from app.models.dfcandle import DataFrameCandle
@@ -20,6 +21,8 @@ if __name__ == "__main__":
 
     streamThread.start()
     serverThread.start()
+    if settings.retention_enabled:
+        RetentionJob().start()
 
     streamThread.join()
     serverThread.join()
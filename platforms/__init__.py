@@ -5,4 +5,5 @@ from .base import OrderTimeoutError
 from .base import Position
 from .base import Trade
 from .oanda import APIClient as OandaClient
-from .bitflyer import APIClient as BitflyerClient
\ No newline at end of file
+from .bitflyer import APIClient as BitflyerClient
+from .replay import APIClient as ReplayClient
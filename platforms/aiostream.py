@@ -0,0 +1,206 @@
+import asyncio
+from collections import deque
+from collections import OrderedDict
+import json
+import logging
+
+import aiohttp
+import websockets
+
+from platforms import Ticker
+from platforms.bitflyer import stream_url as bitflyer_stream_url
+from platforms.bitflyer import ticker_from_message
+from platforms.oanda import ticker_from_price
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_CONFLATE = 'conflate'
+OVERFLOW_POLICIES = [OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_CONFLATE]
+
+OANDA_STREAM_URLS = {
+    'practice': 'https://stream-fxpractice.oanda.com',
+    'live': 'https://stream-fxtrade.oanda.com',
+}
+
+
+class TickQueue(object):
+    """Bounded queue between a stream reader and its consumer.
+
+    When the queue is full ``block`` makes the reader wait, ``drop_oldest``
+    discards the oldest queued ticker, ``drop_newest`` the incoming one and
+    ``conflate`` keeps only the latest ticker of each product code.
+    """
+
+    def __init__(self, maxsize=1000, overflow=OVERFLOW_BLOCK):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'unknown overflow policy: {overflow}')
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.items = OrderedDict() if overflow == OVERFLOW_CONFLATE else deque()
+        self.condition = asyncio.Condition()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+        self.conflated = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    async def put(self, ticker: Ticker):
+        async with self.condition:
+            self.received += 1
+            if self.overflow == OVERFLOW_CONFLATE and ticker.product_code in self.items:
+                self.items[ticker.product_code] = ticker
+                self.conflated += 1
+                return
+
+            while len(self.items) >= self.maxsize:
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+                elif self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                else:
+                    await self.condition.wait()
+
+            if self.overflow == OVERFLOW_CONFLATE:
+                self.items[ticker.product_code] = ticker
+            else:
+                self.items.append(ticker)
+            self.condition.notify_all()
+
+    async def get(self):
+        """Return the next ticker, or None once the queue is closed and drained."""
+        async with self.condition:
+            while not self.items and not self.closed:
+                await self.condition.wait()
+            if not self.items:
+                return None
+            if self.overflow == OVERFLOW_CONFLATE:
+                _, ticker = self.items.popitem(last=False)
+            else:
+                ticker = self.items.popleft()
+            self.condition.notify_all()
+            return ticker
+
+    async def close(self):
+        async with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class OandaStream(object):
+    def __init__(self, access_token, account_id, instruments, environment='practice', base_url=None):
+        if base_url is None:
+            base_url = OANDA_STREAM_URLS[environment]
+        self.url = f'{base_url}/v3/accounts/{account_id}/pricing/stream'
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+        self.params = {'instruments': instruments}
+
+    async def read(self, queue: TickQueue):
+        async with aiohttp.ClientSession(headers=self.headers) as session:
+            async with session.get(self.url, params=self.params, timeout=None) as resp:
+                resp.raise_for_status()
+                async for line in resp.content:
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    if message.get('type') == 'PRICE':
+                        await queue.put(ticker_from_price(message))
+
+
+class BitflyerStream(object):
+    def __init__(self, product_code, url=bitflyer_stream_url):
+        self.url = url
+        self.channel = 'lightning_ticker_' + product_code
+
+    async def read(self, queue: TickQueue):
+        async with websockets.connect(self.url) as ws:
+            await ws.send(json.dumps({'method': 'subscribe', 'params': {'channel': self.channel}}))
+            async for message in ws:
+                await queue.put(ticker_from_message(message))
+
+
+class APIClient(object):
+    """Runs a stream on an asyncio loop behind the ``get_realtime_ticker`` contract.
+
+    Socket reads only wait on the bounded queue, while the callback runs in
+    a worker thread, one ticker at a time and in queue order.
+
+    When the stream ends or fails it is opened again after
+    ``reconnect_delay`` seconds, doubled on every attempt that received no
+    ticker up to ``max_reconnect_delay``. After ``max_reconnects``
+    reconnections (None: no limit) it is not opened again, and its last
+    error, if any, is raised.
+    """
+
+    def __init__(self, stream, maxsize=None, overflow=None,
+                 reconnect_delay=None, max_reconnect_delay=None, max_reconnects=None):
+        if maxsize is None:
+            maxsize = settings.stream_queue_size
+        if overflow is None:
+            overflow = settings.stream_overflow
+        if reconnect_delay is None:
+            reconnect_delay = settings.stream_reconnect_delay
+        if max_reconnect_delay is None:
+            max_reconnect_delay = settings.stream_max_reconnect_delay
+        self.stream = stream
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_reconnects = max_reconnects
+        self.reconnects = 0
+        self.queue = None
+
+    def get_realtime_ticker(self, callback):
+        asyncio.run(self.run(callback))
+
+    async def run(self, callback):
+        self.queue = TickQueue(self.maxsize, self.overflow)
+        consumer = asyncio.ensure_future(self._consume(callback))
+        try:
+            await self._read()
+        finally:
+            await self.queue.close()
+            await consumer
+            logger.info(f'action=get_realtime_ticker status=closed dropped={self.queue.dropped} '
+                        f'conflated={self.queue.conflated}')
+
+    async def _read(self):
+        delay = self.reconnect_delay
+        while True:
+            received = self.queue.received
+            try:
+                await self.stream.read(self.queue)
+                error = None
+            except Exception as e:
+                logger.error(f'action=get_realtime_ticker error={e}')
+                error = e
+            if self.max_reconnects is not None and self.reconnects >= self.max_reconnects:
+                if error is not None:
+                    raise error
+                return
+            if self.queue.received > received:
+                delay = self.reconnect_delay
+            logger.warning(f'action=get_realtime_ticker status=reconnect delay={delay}')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+            self.reconnects += 1
+
+    async def _consume(self, callback):
+        loop = asyncio.get_running_loop()
+        while True:
+            ticker = await self.queue.get()
+            if ticker is None:
+                return
+            try:
+                await loop.run_in_executor(None, callback, ticker)
+            except Exception as e:
+                logger.error(f'action=consume error={e}')
@@ -1,6 +1,7 @@
 from datetime import datetime
 import logging
-import math
+
+import numpy as np
 
 import constants
 
@@ -51,47 +52,24 @@ class Ticker(object):
         return datetime.utcfromtimestamp(self.timestamp)
 
     def truncate_date_time(self, duration):
-        ticker_time = self.time
-        if duration == constants.DURATION_5S:
-            new_sec = math.floor(self.time.second / 5) * 5
-            ticker_time = datetime(
-                self.time.year, self.time.month, self.time.day,
-                self.time.hour, self.time.minute, new_sec
-            )
-            time_format = '%Y-%m-%d %H:%M:%S'
-        elif duration == constants.DURATION_1M:
-            time_format = '%Y-%m-%d %H:%M'
-        elif duration == constants.DURATION_5M:
-            new_min = math.floor(self.time.minute / 5) * 5
-            ticker_time = datetime(
-                self.time.year, self.time.month, self.time.day,
-                self.time.hour, new_min
-            )
-            time_format = '%Y-%m-%d %H:%M'
-        elif duration == constants.DURATION_15M:
-            new_min = math.floor(self.time.minute / 15) * 15
-            ticker_time = datetime(
-                self.time.year, self.time.month, self.time.day,
-                self.time.hour, new_min
-            )
-            time_format = '%Y-%m-%d %H:%M'
-        elif duration == constants.DURATION_30M:
-            new_min = math.floor(self.time.minute / 30) * 30
-            ticker_time = datetime(
-                self.time.year, self.time.month, self.time.day,
-                self.time.hour, new_min
-            )
-            time_format = '%Y-%m-%d %H:%M'
-        elif duration == constants.DURATION_1H:
-            time_format = '%Y-%m-%d %H'
-        elif duration == constants.DURATION_1D:
-            time_format = '%Y-%m-%d'
-        else:
+        seconds = constants.DURATION_SECONDS.get(duration)
+        if seconds is None:
             logger.warning('action=truncate_date_time error=no_datetime_format')
             return None
+        return datetime.utcfromtimestamp(self.timestamp // seconds * seconds)
+
+
+def truncate_timestamps(timestamps, duration):
+    """Floor epoch timestamps to the start of their ``duration`` bucket, as int64 epoch seconds.
 
-        str_date = datetime.strftime(ticker_time, time_format)
-        return datetime.strptime(str_date, time_format)
+    The batch counterpart of ``Ticker.truncate_date_time``.
+    """
+    seconds = constants.DURATION_SECONDS.get(duration)
+    if seconds is None:
+        logger.warning('action=truncate_timestamps error=unknown_duration')
+        return None
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return np.floor_divide(timestamps, seconds).astype(np.int64) * seconds
 
 
 class Order(object):
@@ -1,4 +1,5 @@
 from datetime import datetime
+from datetime import timezone
 import json
 import logging
 import requests
@@ -23,6 +24,61 @@ ORDER_FILLED = 'COMPLETED'
 logger = logging.getLogger(__name__)
 
 base_url = "https://api.bitflyer.jp/v1/"
+stream_url = 'wss://ws.lightstream.bitflyer.com/json-rpc'
+# bitFlyer has no public OHLC endpoint, so history comes from Cryptowatch.
+cryptowatch_url = 'https://api.cryptowat.ch'
+
+CRYPTOWATCH_PAIRS = {
+    'FX_BTC_JPY': 'btcfxjpy',
+    'BTC_JPY': 'btcjpy',
+    'ETH_JPY': 'ethjpy',
+}
+
+
+def ticker_from_message(message) -> Ticker:
+    output = json.loads(message)['params']
+    logger.debug(output)
+    timestamp = datetime.timestamp(dateutil.parser.parse(output['message']['timestamp']))
+    instrument = output['message']['product_code']
+    bid = float(output['message']['best_bid'])
+    ask = float(output['message']['best_ask'])
+    volume = float(output['message']['volume'])
+    return Ticker(instrument, timestamp, bid, ask, volume)
+
+
+class CandleSource(object):
+    """Completed bitFlyer candles from the Cryptowatch ``ohlc`` endpoint.
+
+    Cryptowatch has no 5 second period, so 5S history cannot be backfilled.
+    """
+
+    def __init__(self, base_url=cryptowatch_url, timeout=30):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def supports(self, duration):
+        return duration != constants.DURATION_5S and duration in constants.DURATION_SECONDS
+
+    def fetch(self, product_code, duration, start):
+        """Candles from ``start`` as (time, open, close, high, low, volume)."""
+        period = constants.DURATION_SECONDS[duration]
+        after = int(start.replace(tzinfo=timezone.utc).timestamp()) + period
+        resp = requests.get(f'{self.base_url}/markets/bitflyer/{CRYPTOWATCH_PAIRS[product_code]}/ohlc',
+                            params={'periods': period, 'after': after}, timeout=self.timeout)
+        if resp.status_code >= 400:
+            logger.error(f'action=fetch_candles status_code={resp.status_code} error={resp.text}')
+            resp.raise_for_status()
+
+        # Rows are [close time, open, high, low, close, volume, quote volume]
+        # and the last one is the candle still in progress.
+        now = time.time()
+        candles = []
+        for close_time, open, high, low, close, volume, _ in resp.json()['result'].get(str(period)) or []:
+            if close_time > now:
+                continue
+            candles.append((datetime.utcfromtimestamp(close_time - period),
+                            float(open), float(close), float(high), float(low), float(volume)))
+        return candles
 
 
 class RealtimeAPI(object):
@@ -47,14 +103,7 @@ class RealtimeAPI(object):
     """
     # when we get message
     def on_message(self, ws, message):
-        output = json.loads(message)['params']
-        logger.info(output)
-        timestamp = datetime.timestamp(dateutil.parser.parse(output['message']['timestamp']))
-        instrument = output['message']['product_code']
-        bid = float(output['message']['best_bid'])
-        ask = float(output['message']['best_ask'])
-        volume = float(output['message']['volume'])
-        ticker = Ticker(instrument, timestamp, bid, ask, volume)
+        ticker = ticker_from_message(message)
         self.callback(ticker)
 
     # when error occurs
@@ -145,9 +194,8 @@ class APIClient(object):
     #     return int(resp['candles'][0]['volume'])
 
     def get_realtime_ticker(self, callback, product_code=constants.PRODUCT_CODE_FX_BTC_JPY):
-        url = 'wss://ws.lightstream.bitflyer.com/json-rpc'
         channel = 'lightning_ticker_' + product_code
-        req = RealtimeAPI(url, channel, callback)
+        req = RealtimeAPI(stream_url, channel, callback)
         count = 0
         try:
             while True:
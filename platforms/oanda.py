@@ -1,5 +1,6 @@
 
 from datetime import datetime
+from datetime import timezone
 import json
 import logging
 import requests
@@ -30,7 +31,77 @@ ORDER_FILLED = 'FILLED'
 
 logger = logging.getLogger(__name__)
 
-ticker_log_path = '/Users/shugo/ticker_timestamp.txt'
+# Oanda candle volume is the number of price updates in the candle, so each
+# streamed PRICE message contributes exactly one tick of volume.
+STREAM_TICK_VOLUME = 1
+
+
+OANDA_REST_URLS = {
+    'practice': 'https://api-fxpractice.oanda.com',
+    'live': 'https://api-fxtrade.oanda.com',
+}
+
+# Oanda spells the daily granularity 'D'.
+CANDLE_GRANULARITIES = {
+    duration: 'D' if trade['granularity'] == constants.GRANULARITY_1D else trade['granularity']
+    for duration, trade in constants.TRADE_MAP.items()
+}
+
+
+def ticker_from_price(resp) -> Ticker:
+    timestamp = datetime.timestamp(
+        dateutil.parser.parse(resp['time']))
+    instrument = resp['instrument']
+    bid = float(resp['bids'][0]['price'])
+    ask = float(resp['asks'][0]['price'])
+    return Ticker(instrument, timestamp, bid, ask, STREAM_TICK_VOLUME)
+
+
+class CandleSource(object):
+    """Completed mid candles from the REST ``instruments/{instrument}/candles`` endpoint.
+
+    Daily candles are aligned on UTC midnight like the stored ones.
+    """
+
+    def __init__(self, access_token, environment='practice', base_url=None, page_size=5000, timeout=30):
+        if base_url is None:
+            base_url = OANDA_REST_URLS[environment]
+        self.base_url = base_url
+        self.headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept-Datetime-Format': 'UNIX',
+        }
+        self.page_size = page_size
+        self.timeout = timeout
+
+    def supports(self, duration):
+        return duration in CANDLE_GRANULARITIES
+
+    def fetch(self, product_code, duration, start):
+        """Up to ``page_size`` candles from ``start`` as (time, open, close, high, low, volume)."""
+        params = {
+            'price': 'M',
+            'granularity': CANDLE_GRANULARITIES[duration],
+            'from': f'{start.replace(tzinfo=timezone.utc).timestamp():.0f}',
+            'count': self.page_size,
+            'dailyAlignment': 0,
+            'alignmentTimezone': 'UTC',
+        }
+        resp = requests.get(f'{self.base_url}/v3/instruments/{product_code}/candles',
+                            params=params, headers=self.headers, timeout=self.timeout)
+        if resp.status_code >= 400:
+            logger.error(f'action=fetch_candles status_code={resp.status_code} error={resp.text}')
+            resp.raise_for_status()
+
+        candles = []
+        for candle in resp.json()['candles']:
+            if not candle['complete']:
+                continue
+            mid = candle['mid']
+            candles.append((datetime.utcfromtimestamp(float(candle['time'])),
+                            float(mid['o']), float(mid['c']), float(mid['h']),
+                            float(mid['l']), int(candle['volume'])))
+        return candles
 
 
 class APIClient(object):
@@ -82,16 +153,19 @@ class APIClient(object):
         instrument = price['instrument']
         bid = float(price['bids']['0']['price'])
         ask = float(price['asks']['0']['price'])
-        volume = self.get_candle_volume()
+        volume = self.get_candle_volume(product_code=instrument)
         return Ticker(instrument, timestamp, bid, ask, volume)
 
     def get_candle_volume(self, count=1,
-                          granularity=constants.TRADE_MAP[settings.trade_duration]['granularity']):
+                          granularity=constants.TRADE_MAP[settings.trade_duration]['granularity'],
+                          product_code=None):
+        if product_code is None:
+            product_code = settings.product_code
         params = {
             'count': count,
             'granularity': granularity
         }
-        req = instruments.InstrumentsCandles(instrument=settings.product_code,
+        req = instruments.InstrumentsCandles(instrument=product_code,
                                              params=params)
         try:
             resp = self.client.request(req)
@@ -108,16 +182,8 @@ class APIClient(object):
         try:
             for resp in self.client.request(req):
                 if resp['type'] == 'PRICE':
-                    timestamp = datetime.timestamp(
-                        dateutil.parser.parse(resp['time']))
-                    instrument = resp['instrument']
-                    bid = float(resp['bids'][0]['price'])
-                    ask = float(resp['asks'][0]['price'])
-                    volume = self.get_candle_volume()
-                    ticker = Ticker(instrument, timestamp, bid, ask, volume)
+                    ticker = ticker_from_price(resp)
                     callback(ticker)
-                    with open(ticker_log_path, mode='w') as f:
-                        f.write(str(timestamp))
 
         except V20Error as e:
             requests.post(settings.WEB_HOOK_URL, data=json.dumps({
@@ -0,0 +1,66 @@
+from datetime import datetime
+from datetime import timezone
+import logging
+import time
+
+import constants
+from platforms import Ticker
+
+logger = logging.getLogger(__name__)
+
+
+def ticks_from_candles(product_code, candles, seconds=5):
+    """Synthesize open/high/low/close ticks from stored candles.
+
+    Each candle becomes four ticks spread over its duration: an up candle
+    visits its low before its high, a down candle the reverse. The candle
+    volume is carried by the closing tick so the re-aggregated volume
+    matches the source.
+    """
+    step = seconds / 4
+    for candle in candles:
+        if isinstance(candle.time, datetime):
+            timestamp = candle.time.replace(tzinfo=timezone.utc).timestamp()
+        else:
+            timestamp = float(candle.time)
+        if candle.close >= candle.open:
+            prices = (candle.open, candle.low, candle.high, candle.close)
+        else:
+            prices = (candle.open, candle.high, candle.low, candle.close)
+        for i, price in enumerate(prices):
+            volume = candle.volume if i == 3 else 0
+            yield Ticker(product_code, timestamp + i * step, price, price, volume)
+
+
+def ticks_from_journal(records):
+    """Convert journal records (see app.models.journal) back into Tickers."""
+    for timestamp, bid, ask, volume, product_id in records.tolist():
+        yield Ticker(constants.PRODUCT_CODES_BY_ID.get(product_id), timestamp, bid, ask, volume)
+
+
+class APIClient(object):
+    """Replays recorded ticks through the ``get_realtime_ticker`` contract.
+
+    Ticks are delivered back to back, without any network I/O or sleeps, so
+    the rate is bounded only by the callback.
+    """
+
+    def __init__(self, ticks):
+        self.ticks = ticks
+        self.count = 0
+        self.elapsed = 0.0
+
+    def get_realtime_ticker(self, callback):
+        start = time.perf_counter()
+        for ticker in self.ticks:
+            callback(ticker)
+            self.count += 1
+        self.elapsed = time.perf_counter() - start
+        logger.info(f'action=get_realtime_ticker status=replayed ticks={self.count} '
+                    f'elapsed={self.elapsed:.3f}')
+
+    @property
+    def ticks_per_second(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.count / self.elapsed
@@ -0,0 +1,128 @@
+"""Compare the /api/candle encodings on size, encode and decode time.
+
+Builds a DataFrameCandle over synthetic 5S candles with every indicator
+of the chart, then encodes its value as ``json``, ``columns`` and
+``binary``. Each encoding is decoded back and checked against the
+original, candles exactly and indicators with NaN as 0 for the JSON
+encodings:
+
+    python scripts/bench_candle_encoding.py --rows 1000,10000,100000
+"""
+from argparse import ArgumentParser
+from email.utils import parsedate_to_datetime
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.arrays import CandleArrays  # noqa: E402
+from app.models.dfcandle import DataFrameCandle  # noqa: E402
+from app.models.dfcandle import nan_to_zero  # noqa: E402
+from app.models.encoding import dumps  # noqa: E402
+from app.models.encoding import FORMAT_BINARY  # noqa: E402
+from app.models.encoding import FORMAT_COLUMNS  # noqa: E402
+from app.models.encoding import FORMAT_JSON  # noqa: E402
+from app.models.encoding import pack  # noqa: E402
+from app.models.encoding import unpack  # noqa: E402
+import constants  # noqa: E402
+
+
+def synthetic_candles(rows):
+    times = np.datetime64('2020-01-01T00:00:00', 's') + np.arange(rows) * 5
+    prices = np.round(100 + np.cumsum(np.random.standard_normal(rows) * 0.01), 3)
+    return CandleArrays(times, prices, prices + 0.001, prices + 0.002, prices - 0.002,
+                        (np.arange(rows) % 100).astype(np.float64))
+
+
+def dataframe(rows):
+    df = DataFrameCandle(constants.PRODUCT_CODE_USD_JPY, constants.DURATION_5S)
+    df.candles = synthetic_candles(rows)
+    for period in (7, 14, 50):
+        df.add_sma(period)
+        df.add_ema(period)
+    df.add_bbands(20, 2.0)
+    df.add_atr(20, 2.0)
+    df.add_di(14)
+    df.add_adx(14)
+    df.add_ichimoku()
+    df.add_rsi(14)
+    df.add_macd(12, 26, 9)
+    for period in (1, 2, 13):
+        df.add_force_index(period)
+    return df
+
+
+def encoders(df):
+    return {
+        FORMAT_JSON: (lambda: dumps(df.value).encode(), json.loads),
+        FORMAT_COLUMNS: (lambda: dumps(df.columnar_value).encode(), json.loads),
+        FORMAT_BINARY: (lambda: pack(df.columnar_value), unpack),
+    }
+
+
+def same(expected, actual, keep_nan):
+    """``actual`` is ``expected`` decoded, arrays with NaN as 0 unless ``keep_nan``."""
+    if isinstance(expected, np.ndarray):
+        if not keep_nan:
+            expected = nan_to_zero(expected)
+        return np.array_equal(expected, np.asarray(actual, dtype=expected.dtype), equal_nan=True)
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and expected.keys() == actual.keys() and \
+            all(same(v, actual[k], keep_nan) for k, v in expected.items())
+    if isinstance(expected, list):
+        return isinstance(actual, list) and len(expected) == len(actual) and \
+            all(same(e, a, keep_nan) for e, a in zip(expected, actual))
+    return json.loads(dumps(expected)) == actual
+
+
+def decoded_candles(value, encoding):
+    if encoding == FORMAT_JSON:
+        return CandleArrays.from_rows([(parsedate_to_datetime(c['time']).replace(tzinfo=None), c['open'],
+                                        c['close'], c['high'], c['low'], c['volume'])
+                                       for c in value['candles']])
+    return CandleArrays.from_columns(value['candles'])
+
+
+def same_candles(expected, actual):
+    return all(np.array_equal(getattr(expected, field), getattr(actual, field))
+               for field in ('time', 'open', 'close', 'high', 'low', 'volume'))
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"rows":>8} {"format":>8} {"bytes":>10} {"gzip":>10} {"encode_ms":>10} {"decode_ms":>10} {"round_trip":>10}')
+    for rows in [int(r) for r in args.rows.split(',')]:
+        df = dataframe(rows)
+        for encoding, (encode, decode) in encoders(df).items():
+            encode_s, body = best_of(encode, args.repeat)
+            decode_s, decoded = best_of(lambda: decode(body), args.repeat)
+            expected = df.columnar_value if encoding != FORMAT_JSON else df.value
+            ok = same(expected, decoded, keep_nan=encoding == FORMAT_BINARY) and \
+                same_candles(df.candles, decoded_candles(decoded, encoding))
+            failed |= not ok
+            print(f'{rows:>8} {encoding:>8} {len(body):>10} {len(gzip.compress(body, 6)):>10} '
+                  f'{encode_s * 1000:>10.1f} {decode_s * 1000:>10.1f} {"ok" if ok else "FAILED":>10}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compare the ORM candle fetch with the NumPy (Core select) fetch.
+
+Fills a scratch SQLite database with synthetic 5S candles and times
+``get_all_candles`` against ``get_candle_arrays`` for each row count:
+
+    python scripts/bench_candle_fetch.py --rows 1000,100000,1000000
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+from datetime import timedelta
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.base import Session  # noqa: E402
+from app.models.candle import per_table_candle_class  # noqa: E402
+import constants  # noqa: E402
+
+
+def fill(engine, model, rows):
+    model.__table__.drop(bind=engine, checkfirst=True)
+    model.__table__.create(bind=engine)
+    start = datetime(2020, 1, 1)
+    prices = 100 + np.cumsum(np.random.standard_normal(rows) * 0.01)
+    values = [{'time': start + timedelta(seconds=5 * i), 'open': p, 'close': p + 0.001,
+               'high': p + 0.002, 'low': p - 0.002, 'volume': i % 100}
+              for i, p in enumerate(prices.tolist())]
+    with engine.begin() as conn:
+        for i in range(0, rows, 100000):
+            conn.execute(model.__table__.insert(), values[i:i + 100000])
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='1000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.sql')
+    engine = create_engine(f'sqlite:///{path}')
+    Session.configure(bind=engine)
+    model = per_table_candle_class(constants.PRODUCT_CODE_USD_JPY, constants.DURATION_5S)
+
+    print(f'{"rows":>10} {"orm_s":>10} {"numpy_s":>10} {"speedup":>8}')
+    for rows in [int(r) for r in args.rows.split(',')]:
+        fill(engine, model, rows)
+        orm = best_of(lambda: model.get_all_candles(rows), args.repeat)
+        arrays = best_of(lambda: model.get_candle_arrays(rows), args.repeat)
+        assert len(model.get_candle_arrays(rows)) == rows
+        print(f'{rows:>10} {orm:>10.4f} {arrays:>10.4f} {orm / arrays:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
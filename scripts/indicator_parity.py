@@ -0,0 +1,119 @@
+"""Check the streaming indicators against talib on stored candles.
+
+Each indicator of ``tradingalgo.streaming`` is run over the candles of
+every duration and compared value by value with the batch function. The
+same indicators are then driven through ``IndicatorEngine`` the way the
+trade loop does, with a wrong open candle committed and revised on every
+step:
+
+    python scripts/indicator_parity.py --db fxdata.sql
+"""
+from argparse import ArgumentParser
+import os
+import sys
+
+import numpy as np
+from sqlalchemy import create_engine
+import talib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.base import Session  # noqa: E402
+from app.models.candle import factory_candle_class  # noqa: E402
+import constants  # noqa: E402
+from tradingalgo.algo import ichimoku_cloud  # noqa: E402
+from tradingalgo.streaming import Atr  # noqa: E402
+from tradingalgo.streaming import BBands  # noqa: E402
+from tradingalgo.streaming import Dmi  # noqa: E402
+from tradingalgo.streaming import Ema  # noqa: E402
+from tradingalgo.streaming import Ichimoku  # noqa: E402
+from tradingalgo.streaming import IndicatorEngine  # noqa: E402
+from tradingalgo.streaming import Macd  # noqa: E402
+from tradingalgo.streaming import Rsi  # noqa: E402
+from tradingalgo.streaming import Sma  # noqa: E402
+
+
+def cases(candles):
+    closes, highs, lows = candles.close, candles.high, candles.low
+    return [
+        ('SMA(7)', Sma(7), talib.SMA(closes, 7)),
+        ('EMA(5)', Ema(5), talib.EMA(closes, 5)),
+        ('EMA(25)', Ema(25), talib.EMA(closes, 25)),
+        ('BBANDS(20,2)', BBands(20, 2.0), talib.BBANDS(closes, 20, 2.0, 2.0, 0)),
+        ('RSI(14)', Rsi(14), talib.RSI(closes, 14)),
+        ('ATR(14)', Atr(14), talib.ATR(highs, lows, closes, 14)),
+        ('DMI(14)', Dmi(14), (talib.PLUS_DI(highs, lows, closes, 14), talib.MINUS_DI(highs, lows, closes, 14),
+                              talib.ADX(highs, lows, closes, 14), talib.ADXR(highs, lows, closes, 14))),
+        ('MACD(12,26,9)', Macd(12, 26, 9), talib.MACD(closes, 12, 26, 9)),
+        ('ICHIMOKU', Ichimoku(), tuple(ichimoku_cloud(closes.tolist()))),
+    ]
+
+
+def as_array(values, length):
+    """Columns of the batch outputs, or values of the streaming ones, as a (length, ...) array."""
+    if isinstance(values, tuple):
+        return np.column_stack([np.asarray(v, dtype=np.float64)[:length] for v in values])
+    return np.asarray(values, dtype=np.float64)[:length]
+
+
+def compare(actual, expected):
+    """Max relative difference, or None when the NaN positions differ."""
+    if actual.shape != expected.shape or not np.array_equal(np.isnan(actual), np.isnan(expected)):
+        return None
+    finite = ~np.isnan(expected)
+    diff = np.abs(actual[finite] - expected[finite]) / np.maximum(np.abs(expected[finite]), 1.0)
+    return float(np.max(diff, initial=0.0))
+
+
+def format_diff(diff):
+    return 'nan-mismatch' if diff is None else f'{diff:.1e}'
+
+
+def revised(candle):
+    return candle._replace(close=candle.close * 1.01, high=candle.high * 1.02, low=candle.low * 0.98)
+
+
+def engine_values(indicators, rows):
+    """Values of every step when the open candle is peeked, committed wrong, then revised."""
+    engine = IndicatorEngine(indicators, history=1)
+    peeked = {name: [] for name in indicators}
+    updated = {name: [] for name in indicators}
+    for i in range(len(rows)):
+        for name, value in engine.peek(rows[i]).items():
+            peeked[name].append(value[-1])
+        engine.update(rows[max(i - 1, 0):i] + [revised(rows[i])])
+        for name, value in engine.update(rows[max(i - 1, 0):i + 1]).items():
+            updated[name].append(value[-1])
+    return peeked, updated
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='fxdata.sql')
+    parser.add_argument('--product-code', default=constants.PRODUCT_CODE_USD_JPY)
+    parser.add_argument('--limit', type=int, default=100000)
+    args = parser.parse_args()
+
+    Session.configure(bind=create_engine(f'sqlite:///{args.db}'))
+
+    failed = False
+    print(f'{"duration":>8} {"candles":>8} {"indicator":>14} {"run":>12} {"peek":>12} {"update":>12}')
+    for duration in constants.DURATIONS:
+        candles = factory_candle_class(args.product_code, duration).get_candle_arrays(args.limit)
+        if not len(candles):
+            continue
+        rows = list(candles)
+        checks = cases(candles)
+        peeked, updated = engine_values({name: indicator for name, indicator, _ in checks}, rows)
+        for name, indicator, expected in checks:
+            expected = as_array(expected, len(candles))
+            diffs = [compare(as_array(values, len(candles)), expected)
+                     for values in (indicator.run(rows), peeked[name], updated[name])]
+            failed |= any(diff is None or diff > 1e-9 for diff in diffs)
+            print(f'{duration:>8} {len(candles):>8} {name:>14} '
+                  f'{" ".join(f"{format_diff(diff):>12}" for diff in diffs)}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
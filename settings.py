@@ -1,10 +1,11 @@
 import configparser
+import os
 
 from utils.utils import bool_from_str
 
 
 conf = configparser.ConfigParser()
-conf.read('settings.ini')
+conf.read(os.environ.get('FINANCE_SETTINGS', 'settings.ini'))
 
 client = "bitflyer"
 
@@ -25,9 +26,46 @@ elif client.lower() == "bitflyer":
 
 db_name = conf['db']['name']
 db_driver = conf['db']['driver']
+db_url = conf.get('db', 'url', fallback=None)
+candle_storage = conf.get('db', 'candle_storage', fallback='per_table')
+db_pool_size = conf.getint('db', 'pool_size', fallback=5)
+db_max_overflow = conf.getint('db', 'max_overflow', fallback=10)
+db_pool_pre_ping = conf.getboolean('db', 'pool_pre_ping', fallback=True)
+db_pool_recycle = conf.getint('db', 'pool_recycle', fallback=3600)
+db_sqlite_journal_mode = conf.get('db', 'sqlite_journal_mode', fallback='WAL')
+db_sqlite_synchronous = conf.get('db', 'sqlite_synchronous', fallback='NORMAL')
+db_sqlite_mmap_size = conf.getint('db', 'sqlite_mmap_size', fallback=256 * 1024 * 1024)
+db_sqlite_cache_size = conf.getint('db', 'sqlite_cache_size', fallback=-64 * 1024)
+db_sqlite_temp_store = conf.get('db', 'sqlite_temp_store', fallback='MEMORY')
 
 web_port = int(conf['web']['port'])
 
+tick_journal_dir = conf.get('journal', 'directory', fallback='tick_journal')
+tick_journal_flush_interval = conf.getfloat('journal', 'flush_interval', fallback=1.0)
+column_store_dir = conf.get('columnstore', 'directory', fallback='column_store')
+indicator_cache_bytes = conf.getint('indicator', 'cache_bytes', fallback=64 * 1024 * 1024)
+
+writer_max_queue_size = conf.getint('writer', 'max_queue_size', fallback=10000)
+writer_batch_size = conf.getint('writer', 'batch_size', fallback=500)
+writer_flush_interval = conf.getfloat('writer', 'flush_interval', fallback=1.0)
+
+stream_queue_size = conf.getint('stream', 'queue_size', fallback=1000)
+stream_overflow = conf.get('stream', 'overflow', fallback='block')
+stream_reconnect_delay = conf.getfloat('stream', 'reconnect_delay', fallback=1.0)
+stream_max_reconnect_delay = conf.getfloat('stream', 'max_reconnect_delay', fallback=60.0)
+
+retention_enabled = conf.getboolean('retention', 'enabled', fallback=False)
+retention_horizon_days = conf.getint('retention', 'horizon_days', fallback=30)
+retention_batch_size = conf.getint('retention', 'batch_size', fallback=5000)
+retention_interval = conf.getint('retention', 'interval', fallback=3600)
+retention_archive_dir = conf.get('retention', 'archive_dir', fallback='')
+
+backfill_oanda_url = conf.get('backfill', 'oanda_url', fallback='')
+backfill_cryptowatch_url = conf.get('backfill', 'cryptowatch_url', fallback='https://api.cryptowat.ch')
+backfill_requests_per_second = conf.getfloat('backfill', 'requests_per_second', fallback=10.0)
+backfill_workers = conf.getint('backfill', 'workers', fallback=4)
+backfill_days = conf.getint('backfill', 'days', fallback=30)
+
 trade_duration = conf['pytrading']['trade_duration'].lower()
 back_test = bool_from_str(conf['pytrading']['back_test'])
 live_practice = conf['pytrading']['live_practice']
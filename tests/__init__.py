@@ -0,0 +1,5 @@
+import os
+
+# settings.py reads its configuration on import; the tests use a dummy one
+# with an in-memory database.
+os.environ.setdefault('FINANCE_SETTINGS', os.path.join(os.path.dirname(__file__), 'settings.ini'))
@@ -0,0 +1,163 @@
+from datetime import datetime
+from datetime import timedelta
+import unittest
+
+import numpy as np
+
+from app.models.aggregator import CandleAggregator
+from app.models.base import init_db
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+from platforms.base import Ticker
+
+import constants
+
+PRODUCT_CODE = 'USD_JPY'
+START = datetime(2020, 7, 16, 21, 0).timestamp() - datetime(1970, 1, 1).timestamp()
+
+
+def setUpModule():
+    init_db()
+
+
+def random_ticks(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    times = START + np.cumsum(rng.uniform(0.5, 240, rows))
+    prices = np.round(107 + np.cumsum(rng.normal(0, 0.01, rows)), 3)
+    volumes = rng.integers(1, 10, rows)
+    return [Ticker(PRODUCT_CODE, float(t), float(p), float(p), int(v))
+            for t, p, v in zip(times, prices, volumes)]
+
+
+def clear_candles():
+    for duration in constants.DURATIONS:
+        cls = factory_candle_class(PRODUCT_CODE, duration)
+        with session_scope(table=cls._model().__table__) as session:
+            cls._query(session).delete()
+
+
+def stored_candles():
+    candles = {}
+    for duration in constants.DURATIONS:
+        for candle in factory_candle_class(PRODUCT_CODE, duration).get_all_candles(limit=10 ** 6):
+            candles[(duration, candle.time)] = (candle.open, candle.close, candle.high,
+                                                candle.low, candle.volume)
+    return candles
+
+
+def create_candle_with_duration(product_code, duration, ticker):
+    """Per-tick read-modify-write of one candle, as the stream did before the aggregator."""
+    cls = factory_candle_class(product_code, duration)
+    ticker_time = ticker.truncate_date_time(duration)
+    current_candle = cls.get(ticker_time)
+    price = ticker.mid_price
+    if current_candle is None:
+        cls.create(ticker_time, price, price, price, price, ticker.volume)
+        return True
+
+    if current_candle.high <= price:
+        current_candle.high = price
+    elif current_candle.low >= price:
+        current_candle.low = price
+    current_candle.volume += ticker.volume
+    current_candle.close = price
+    current_candle.save()
+    return False
+
+
+def reference_candles(ticks):
+    """Rows written by updating every duration on every tick, as before the aggregator."""
+    clear_candles()
+    for ticker in ticks:
+        for duration in constants.DURATIONS:
+            create_candle_with_duration(PRODUCT_CODE, duration, ticker)
+    return stored_candles()
+
+
+class CandleAggregatorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ticks = random_ticks(400)
+        cls.expected = reference_candles(cls.ticks)
+
+    def setUp(self):
+        clear_candles()
+
+    def assertSameCandles(self, expected, actual):
+        self.assertEqual(sorted(expected), sorted(actual))
+        for key, values in expected.items():
+            self.assertEqual(values, actual[key], key)
+
+    def test_matches_per_duration_candles(self):
+        aggregator = CandleAggregator()
+        for ticker in self.ticks:
+            aggregator.update(ticker)
+        aggregator.checkpoint()
+        self.assertSameCandles(self.expected, stored_candles())
+
+    def test_open_candles_include_open_finer_candles(self):
+        aggregator = CandleAggregator()
+        for ticker in self.ticks:
+            aggregator.update(ticker)
+        day = self.ticks[-1].truncate_date_time(constants.DURATION_1D)
+        current = aggregator.current(PRODUCT_CODE, constants.DURATION_1D)
+        self.assertEqual((current.open, current.close, current.high, current.low, current.volume),
+                         self.expected[(constants.DURATION_1D, day)])
+
+    def test_restart_does_not_count_seeded_candles_twice(self):
+        for ticks in (self.ticks[:211], self.ticks[211:320], self.ticks[320:]):
+            aggregator = CandleAggregator()
+            for ticker in ticks:
+                aggregator.update(ticker)
+            aggregator.checkpoint()
+        self.assertSameCandles(self.expected, stored_candles())
+
+    def test_replay_does_not_count_stored_candles_twice(self):
+        replayed = self.ticks[100:]
+        expected = reference_candles(replayed)
+        reference_candles(self.ticks)
+        aggregator = CandleAggregator(seed=False)
+        for ticker in replayed:
+            aggregator.update(ticker)
+        aggregator.checkpoint()
+        stored = stored_candles()
+        self.assertSameCandles(expected, {key: stored[key] for key in expected})
+
+    def test_replay_stream_does_not_seed(self):
+        from app.controllers.streamdata import StreamData
+        from app.models.writer import CandleWriter
+        stream = StreamData(client='replay', api=object(), writer=CandleWriter(dry_run=True))
+        try:
+            self.assertFalse(stream.aggregator_for(PRODUCT_CODE).seed)
+        finally:
+            stream.writer.stop()
+            stream.trade_pool.stop()
+
+    def test_late_ticks_keep_durations_consistent(self):
+        aggregator = CandleAggregator()
+        for i, ticker in enumerate(self.ticks):
+            aggregator.update(ticker)
+            if i % 7 == 0 and i > 20:
+                late = self.ticks[i - 1 - i % 13]
+                aggregator.update(Ticker(PRODUCT_CODE, late.timestamp, late.bid + 0.05, late.ask + 0.05, 3))
+        aggregator.checkpoint()
+        self.assertGreater(aggregator.late_ticks, 0)
+
+        candles = stored_candles()
+        base = {time: values for (duration, time), values in candles.items()
+                if duration == constants.DURATION_5S}
+        for duration in constants.DURATIONS[1:]:
+            length = timedelta(seconds=constants.DURATION_SECONDS[duration])
+            for (candle_duration, time), (_, _, high, low, volume) in candles.items():
+                if candle_duration != duration:
+                    continue
+                children = [values for child_time, values in base.items()
+                            if time <= child_time < time + length]
+                self.assertEqual(volume, sum(child[4] for child in children), (duration, time))
+                self.assertEqual(high, max(child[2] for child in children), (duration, time))
+                self.assertEqual(low, min(child[3] for child in children), (duration, time))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import websockets
+
+from platforms.aiostream import APIClient
+from platforms.aiostream import BitflyerStream
+from platforms.aiostream import OVERFLOW_BLOCK
+from platforms.aiostream import OVERFLOW_CONFLATE
+from platforms.aiostream import OVERFLOW_DROP_NEWEST
+from platforms.aiostream import OVERFLOW_DROP_OLDEST
+from platforms.aiostream import TickQueue
+
+PRODUCT_CODE = 'FX_BTC_JPY'
+
+
+def message(i, product_code=PRODUCT_CODE):
+    return json.dumps({'jsonrpc': '2.0', 'method': 'channelMessage', 'params': {
+        'channel': 'lightning_ticker_' + product_code,
+        'message': {'product_code': product_code, 'timestamp': '2020-07-17T10:00:00.000000Z',
+                    'best_bid': 1000000 + i, 'best_ask': 1000000 + i, 'volume': i},
+    }})
+
+
+class FakeServer(object):
+    """Local websocket server sending ``batches[n]`` on its n-th connection, then closing it."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.subscriptions = []
+
+    async def handler(self, ws, *args):
+        self.subscriptions.append(json.loads(await ws.recv()))
+        batch = self.batches[len(self.subscriptions) - 1]
+        for item in batch:
+            await ws.send(item)
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handler, '127.0.0.1', 0)
+        port = next(iter(self.server.sockets)).getsockname()[1]
+        self.url = f'ws://127.0.0.1:{port}'
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class FailingStream(object):
+    """Stream failing on every read, after queueing ``tickers[n]`` on the n-th one."""
+
+    def __init__(self, tickers):
+        self.tickers = tickers
+        self.reads = 0
+
+    async def read(self, queue):
+        tickers = self.tickers[self.reads] if self.reads < len(self.tickers) else []
+        self.reads += 1
+        for ticker in tickers:
+            await queue.put(ticker)
+        raise ConnectionError('connection lost')
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+class ReconnectTest(unittest.TestCase):
+
+    def test_reconnects_after_the_server_closes(self):
+        received = []
+
+        async def scenario():
+            batches = [[message(i) for i in range(3)], [message(i) for i in range(3, 5)]]
+            async with FakeServer(batches) as server:
+                client = APIClient(BitflyerStream(PRODUCT_CODE, url=server.url),
+                                   reconnect_delay=0.01, max_reconnects=1)
+                await client.run(received.append)
+                return server, client
+
+        server, client = run(scenario())
+        self.assertEqual([t.volume for t in received], [0, 1, 2, 3, 4])
+        self.assertEqual(client.reconnects, 1)
+        self.assertEqual(len(server.subscriptions), 2)
+        self.assertEqual(server.subscriptions[1]['params']['channel'], 'lightning_ticker_' + PRODUCT_CODE)
+
+    def test_backoff_doubles_and_resets_after_ticks(self):
+        ticker = object()
+        stream = FailingStream([[], [], [], [ticker], [], []])
+        client = APIClient(stream, reconnect_delay=1, max_reconnect_delay=3, max_reconnects=5)
+        sleep = mock.AsyncMock()
+        with mock.patch('platforms.aiostream.asyncio.sleep', sleep):
+            with self.assertRaises(ConnectionError):
+                run(client.run(lambda t: None))
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2, 3, 1, 2])
+        self.assertEqual(stream.reads, 6)
+
+
+class OverflowTest(unittest.TestCase):
+
+    def flood(self, overflow, count=50, maxsize=5, product_codes=(PRODUCT_CODE,)):
+        """Tickers left in a queue flooded by the server while nothing consumes it."""
+        async def scenario():
+            messages = [message(i, product_codes[i % len(product_codes)]) for i in range(count)]
+            async with FakeServer([messages]) as server:
+                queue = TickQueue(maxsize, overflow)
+                await BitflyerStream(PRODUCT_CODE, url=server.url).read(queue)
+                await queue.close()
+                tickers = []
+                while True:
+                    ticker = await queue.get()
+                    if ticker is None:
+                        return [int(t.volume) for t in tickers], queue
+                    tickers.append(ticker)
+
+        return run(scenario())
+
+    def test_drop_oldest_keeps_the_latest(self):
+        received, queue = self.flood(OVERFLOW_DROP_OLDEST)
+        self.assertEqual(received, list(range(45, 50)))
+        self.assertEqual(queue.dropped, 45)
+
+    def test_drop_newest_keeps_the_first(self):
+        received, queue = self.flood(OVERFLOW_DROP_NEWEST)
+        self.assertEqual(received, list(range(5)))
+        self.assertEqual(queue.dropped, 45)
+
+    def test_conflate_keeps_the_latest_per_product(self):
+        received, queue = self.flood(OVERFLOW_CONFLATE, product_codes=(PRODUCT_CODE, 'BTC_JPY'))
+        self.assertEqual(received, [48, 49])
+        self.assertEqual(queue.conflated, 48)
+
+    def test_block_keeps_everything_in_order(self):
+        received = []
+        depths = []
+
+        async def scenario():
+            async with FakeServer([[message(i) for i in range(50)]]) as server:
+                client = APIClient(BitflyerStream(PRODUCT_CODE, url=server.url),
+                                   maxsize=5, overflow=OVERFLOW_BLOCK, max_reconnects=0)
+
+                def callback(ticker):
+                    depths.append(len(client.queue))
+                    received.append(int(ticker.volume))
+
+                await client.run(callback)
+                return client
+
+        client = run(scenario())
+        self.assertEqual(received, list(range(50)))
+        self.assertEqual(client.queue.dropped, 0)
+        self.assertLessEqual(max(depths), 5)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            TickQueue(overflow='drop_all')
+
+
+if __name__ == '__main__':
+    unittest.main()
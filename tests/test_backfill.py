@@ -0,0 +1,115 @@
+from datetime import datetime
+from datetime import timedelta
+import unittest
+
+from app.controllers.backfill import backfill_table
+from app.controllers.backfill import missing_ranges
+from app.controllers.backfill import RateLimiter
+from app.models.base import init_db
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+
+import constants
+
+PRODUCT_CODE = 'USD_JPY'
+START = datetime(2020, 7, 17, 0, 0)
+END = START + timedelta(hours=4)
+MINUTE = timedelta(minutes=1)
+
+
+def setUpModule():
+    init_db()
+
+
+class StubSource(object):
+    """One minute candles, ``page_size`` per fetch, stamped ``offset`` seconds into their minute.
+
+    Nothing is traded during ``closed`` (start, end).
+    """
+
+    def __init__(self, page_size=50, offset=0, closed=None):
+        self.page_size = page_size
+        self.offset = timedelta(seconds=offset)
+        self.closed = closed
+        self.fetches = []
+
+    def supports(self, duration):
+        return duration == constants.DURATION_1M
+
+    def fetch(self, product_code, duration, start):
+        self.fetches.append(start)
+        time = start.replace(second=0) + self.offset
+        if time < start:
+            time += MINUTE
+        candles = []
+        while len(candles) < self.page_size and time < END + timedelta(hours=1):
+            if self.closed is None or not self.closed[0] <= time < self.closed[1]:
+                candles.append((time, 107.0, 107.1, 107.2, 106.9, 10))
+            time += MINUTE
+        return candles
+
+
+class BackfillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cls = factory_candle_class(PRODUCT_CODE, constants.DURATION_1M)
+        with session_scope(table=self.cls._model().__table__) as session:
+            self.cls._query(session).delete()
+        self.limiter = RateLimiter(1000, burst=100)
+
+    def store(self, minutes):
+        for minute in minutes:
+            self.cls.create(START + minute * MINUTE, 100, 100, 100, 100, 1)
+
+    def backfill(self, source):
+        return backfill_table(source, self.limiter, PRODUCT_CODE, constants.DURATION_1M,
+                              start=START, end=END)
+
+    def stored_times(self):
+        return [c.time for c in self.cls.get_all_candles(limit=10 ** 6)]
+
+    def test_missing_ranges(self):
+        self.store(list(range(0, 30)) + list(range(90, 91)) + list(range(100, 200)))
+        ranges = missing_ranges(self.cls, constants.DURATION_1M, START + timedelta(seconds=20), END)
+        self.assertEqual(ranges, [(START + 30 * MINUTE, START + 90 * MINUTE),
+                                  (START + 91 * MINUTE, START + 100 * MINUTE),
+                                  (START + 200 * MINUTE, END)])
+
+    def test_fills_every_gap_and_pages(self):
+        self.store(list(range(0, 30)) + list(range(90, 91)) + list(range(100, 200)))
+        source = StubSource(page_size=25)
+        self.assertEqual(self.backfill(source), 115)
+        # 30..90 in three pages, the last one running through 90..100; 200..240 in two.
+        self.assertEqual(source.fetches, [START + m * MINUTE for m in (30, 55, 80, 200, 225)])
+        self.assertEqual(self.stored_times(), [START + m * MINUTE for m in range(240)])
+        # Existing rows are kept.
+        self.assertEqual(self.cls.get(START + 90 * MINUTE).volume, 1)
+
+    def test_rerun_is_idempotent(self):
+        self.store(range(0, 240, 7))
+        self.backfill(StubSource())
+        source = StubSource()
+        self.assertEqual(self.backfill(source), 0)
+        self.assertEqual(source.fetches, [])
+        self.assertEqual(len(self.stored_times()), 240)
+
+    def test_closed_market_is_asked_once(self):
+        closed = (START + 60 * MINUTE, START + 120 * MINUTE)
+        source = StubSource(page_size=500, closed=closed)
+        self.assertEqual(self.backfill(source), 180)
+        # The closed hour stays a gap: one request, whose page only holds stored candles.
+        source = StubSource(page_size=500, closed=closed)
+        self.backfill(source)
+        self.assertEqual(source.fetches, [START + 60 * MINUTE])
+        self.assertEqual(len(self.stored_times()), 180)
+
+    def test_fetched_times_are_aligned(self):
+        self.backfill(StubSource(offset=17))
+        times = self.stored_times()
+        self.assertEqual(times[0], START)
+        self.assertTrue(all(t.second == 0 for t in times))
+        self.assertEqual(self.backfill(StubSource(offset=17)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from datetime import datetime
+from datetime import timedelta
+import json
+import threading
+import time
+import unittest
+
+from app.models import base
+from app.models.base import init_db
+from app.models.base import lock_stats_value
+from app.models.base import scope_depth
+from app.models.base import Session
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+
+import constants
+
+PRODUCT_CODE = 'USD_JPY'
+
+
+def setUpModule():
+    init_db()
+
+
+class SessionScopeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cls = factory_candle_class(PRODUCT_CODE, constants.DURATION_1H)
+        self.table = self.cls._model().__table__
+        with session_scope(table=self.table) as session:
+            self.cls._query(session).delete()
+
+    def test_nested_scope_keeps_the_outer_session(self):
+        with session_scope(table=self.table) as outer:
+            outer.add(self.cls._build(time=datetime(2020, 7, 17), open=1, close=1, high=1, low=1, volume=1))
+            with session_scope(readonly=True) as inner:
+                self.assertIs(inner, outer)
+            self.assertTrue(outer.is_active)
+            outer.add(self.cls._build(time=datetime(2020, 7, 17, 1), open=1, close=1, high=1, low=1, volume=1))
+        self.assertEqual(len(self.cls.get_all_candles()), 2)
+        self.assertEqual(scope_depth.value, 0)
+
+    def test_lock_stats_record_wait_and_hold(self):
+        before = lock_stats_value()
+        held = threading.Event()
+
+        def hold():
+            with session_scope(table=self.table):
+                held.set()
+                time.sleep(0.1)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait(5)
+        with session_scope(table=self.table):
+            pass
+        thread.join()
+
+        after = lock_stats_value()
+        self.assertEqual(after['acquired'] - before['acquired'], 2)
+        self.assertGreaterEqual(after['total_wait_ms'] - before['total_wait_ms'], 50)
+        self.assertGreaterEqual(after['max_hold_ms'], 50)
+        self.assertGreater(after['mean_hold_ms'], 0)
+
+    def test_streaming_read_runs_in_a_scope(self):
+        start = datetime(2020, 7, 17)
+        for i in range(5):
+            self.cls.create(start + timedelta(hours=i), 1, 1, 1, 1, 1)
+        blocks = self.cls.get_candles_between(start, chunk_size=2)
+        first = next(blocks)
+        self.assertEqual(scope_depth.value, 1)
+        with session_scope(readonly=True) as session:
+            self.assertIs(session, Session())
+        rest = list(blocks)
+        self.assertEqual([len(first)] + [len(block) for block in rest], [2, 2, 1])
+        self.assertEqual(scope_depth.value, 0)
+
+
+class StatsEndpointTest(unittest.TestCase):
+
+    def test_stats(self):
+        from app.controllers.webserver import app
+        response = app.test_client().get('/api/stats/')
+        self.assertEqual(response.status_code, 200)
+        value = json.loads(response.data)
+        self.assertEqual(set(value), {'db_locks', 'indicator_cache'})
+        self.assertEqual(value['db_locks']['acquired'], base.lock_stats['acquired'])
+        self.assertIn('max_bytes', value['indicator_cache'])
+
+
+if __name__ == '__main__':
+    unittest.main()
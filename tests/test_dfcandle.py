@@ -0,0 +1,104 @@
+from datetime import datetime
+from datetime import timedelta
+import unittest
+
+import numpy as np
+
+from app.models.arrays import CandleArrays
+from app.models.base import init_db
+from app.models.base import session_scope
+from app.models.candle import factory_candle_class
+from app.models.dfcandle import DataFrameCandle
+from app.models.dfcandle import IndicatorCache
+
+import constants
+
+PRODUCT_CODE = 'USD_JPY'
+
+
+def setUpModule():
+    init_db()
+
+
+def candles(rows, shift=0.0):
+    times = np.datetime64('2020-07-17T10:00:00', 's') + np.arange(rows) * 60
+    prices = np.round(107 + np.arange(rows) * 0.001 + shift, 3)
+    return CandleArrays(times, prices, prices, prices + 0.002, prices - 0.002,
+                        np.ones(rows, dtype=np.float64))
+
+
+class IndicatorCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = IndicatorCache(max_bytes=3 * 800)
+        for key in 'abc':
+            cache.get(key, lambda: np.zeros(100))
+        cache.get('a', lambda: self.fail('a is cached'))
+        cache.get('d', lambda: (np.zeros(50), np.zeros(50)))
+        self.assertEqual(cache.bytes, 3 * 800)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(list(cache.entries), ['c', 'a', 'd'])
+
+    def test_does_not_keep_entries_over_budget(self):
+        cache = IndicatorCache(max_bytes=800)
+        cache.get('small', lambda: np.zeros(100))
+        values = cache.get('large', lambda: np.zeros(101))
+        self.assertEqual(len(values), 101)
+        self.assertEqual(list(cache.entries), ['small'])
+        self.assertEqual(cache.bytes, 800)
+
+    def test_cached_arrays_are_read_only(self):
+        values = IndicatorCache(max_bytes=800).get('a', lambda: np.zeros(10))
+        with self.assertRaises(ValueError):
+            values[0] = 1
+
+
+class DataFrameCandleVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = DataFrameCandle(PRODUCT_CODE, constants.DURATION_1M)
+        self.df.cache = IndicatorCache(max_bytes=1024 * 1024)
+        self.cls = factory_candle_class(PRODUCT_CODE, constants.DURATION_1M)
+        with session_scope(table=self.cls._model().__table__) as session:
+            self.cls._query(session).delete()
+
+    def sma(self):
+        return self.df.indicator('SMA', 3)
+
+    def test_assigned_candles_are_hashed(self):
+        self.df.candles = candles(10)
+        first = self.sma()
+        self.df.candles = candles(10)
+        self.assertIs(self.sma(), first)
+        changed = candles(10)
+        changed.close[2] += 1
+        self.df.candles = changed
+        self.assertNotEqual(self.sma()[4], first[4])
+
+    def test_stored_candles_invalidate_on_write(self):
+        start = datetime(2020, 7, 17, 10)
+        for i in range(10):
+            self.cls.create(start + timedelta(minutes=i), 107, 107 + i, 108, 106, 1)
+        self.df.set_all_candles(10)
+        first = self.sma()
+        self.df.set_all_candles(10)
+        self.assertIs(self.sma(), first)
+
+        # An older row changes: bounds and last candle are the same.
+        self.cls.upsert(start + timedelta(minutes=3), 107, 200, 200, 106, 1)
+        self.df.set_all_candles(10)
+        self.assertEqual(self.sma()[4], (109 + 200 + 111) / 3)
+        self.assertEqual(self.df.cache.misses, 2)
+
+    def test_fraction_candle_changes_the_version(self):
+        self.df.set_candles(candles(10), version='stored')
+        version = self.df.version
+        self.df.fraction_candle = self.cls(time=datetime(2020, 7, 17, 10, 10), open=107, close=108,
+                                           high=108, low=107, volume=1)
+        self.df.append_fraction_candle()
+        self.assertNotEqual(self.df.version, version)
+        self.assertEqual(len(self.df.candles), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import json
+import unittest
+
+import numpy as np
+
+from app.models.arrays import CANDLE_FIELDS
+from app.models.arrays import CandleArrays
+from app.models.encoding import BINARY_HEADER
+from app.models.encoding import dumps
+from app.models.encoding import pack
+from app.models.encoding import unpack
+
+
+def candles(rows):
+    times = np.datetime64('2020-07-17T10:00:00', 's') + np.arange(rows) * 5
+    prices = np.round(107 + np.arange(rows) * 0.001, 3)
+    return CandleArrays(times, prices, prices + 0.001, prices + 0.002, prices - 0.002,
+                        (np.arange(rows) % 100).astype(np.float64))
+
+
+def columnar_value(candle_arrays):
+    values = candle_arrays.close.copy()
+    values[:min(6, len(values))] = np.nan
+    return {
+        'product_code': 'USD_JPY',
+        'duration': '5s',
+        'candles': candle_arrays.columns,
+        'smas': [{'period': 7, 'values': values}],
+        'bbands': None,
+        'force_idx': [{'n': 1, 'force_idx': [0] + [0.5] * (len(values) - 1)}],
+        'events': {'signals': None, 'profit': None},
+    }
+
+
+class CandleColumnsTest(unittest.TestCase):
+
+    def assertSameCandles(self, expected, actual):
+        for field in CANDLE_FIELDS:
+            self.assertEqual(getattr(expected, field).dtype, getattr(actual, field).dtype, field)
+            np.testing.assert_array_equal(getattr(expected, field), getattr(actual, field), field)
+
+    def test_columns_round_trip(self):
+        source = candles(50)
+        self.assertSameCandles(source, CandleArrays.from_columns(source.columns))
+
+    def test_columns_round_trip_through_json(self):
+        source = candles(50)
+        decoded = json.loads(dumps(source.columns))
+        self.assertIsInstance(decoded['time'][0], int)
+        self.assertIsInstance(decoded['volume'][0], int)
+        self.assertSameCandles(source, CandleArrays.from_columns(decoded))
+
+    def test_empty_columns(self):
+        source = CandleArrays.empty()
+        self.assertSameCandles(source, CandleArrays.from_columns(json.loads(dumps(source.columns))))
+
+
+class ColumnsFormatTest(unittest.TestCase):
+
+    def test_nan_is_written_as_zero(self):
+        source = candles(20)
+        value = columnar_value(source)
+        decoded = json.loads(dumps(value))
+        np.testing.assert_array_equal(decoded['smas'][0]['values'],
+                                      np.where(np.isnan(value['smas'][0]['values']), 0,
+                                               value['smas'][0]['values']))
+        self.assertEqual(decoded['force_idx'], value['force_idx'])
+        self.assertIsNone(decoded['bbands'])
+
+
+class BinaryFormatTest(unittest.TestCase):
+
+    def round_trip(self, rows):
+        source = candles(rows)
+        value = columnar_value(source)
+        data = pack(value)
+        self.assertEqual((BINARY_HEADER.size + BINARY_HEADER.unpack_from(data)[2]) % 8, 0)
+        return source, value, unpack(data)
+
+    def test_round_trip(self):
+        source, value, decoded = self.round_trip(100)
+        restored = CandleArrays.from_columns(decoded['candles'])
+        for field in CANDLE_FIELDS:
+            np.testing.assert_array_equal(getattr(source, field), getattr(restored, field))
+        self.assertEqual(decoded['candles']['volume'].dtype, np.dtype('<i8'))
+        self.assertEqual(decoded['product_code'], 'USD_JPY')
+        self.assertEqual(decoded['force_idx'], value['force_idx'])
+        self.assertEqual(decoded['events'], value['events'])
+
+    def test_nan_is_kept(self):
+        _, value, decoded = self.round_trip(20)
+        np.testing.assert_array_equal(decoded['smas'][0]['values'], value['smas'][0]['values'])
+        self.assertTrue(np.isnan(decoded['smas'][0]['values'][:6]).all())
+
+    def test_empty_candles(self):
+        _, _, decoded = self.round_trip(0)
+        self.assertEqual(len(CandleArrays.from_columns(decoded['candles'])), 0)
+        self.assertEqual(len(decoded['smas'][0]['values']), 0)
+
+    def test_malformed_packets(self):
+        data = pack(columnar_value(candles(10)))
+        for bad in [b'', data[:5], b'XXXX' + data[4:], data[:BINARY_HEADER.size + 3],
+                    data[:-8], data + b'\0' * 8]:
+            with self.assertRaises(ValueError):
+                unpack(bad)
+
+    def test_malformed_header(self):
+        header = b'{"columns":[["<f8",-1]],"value":{"$column":0}}'
+        header += b' ' * (-(BINARY_HEADER.size + len(header)) % 8)
+        with self.assertRaises(ValueError):
+            unpack(BINARY_HEADER.pack(b'FXCB', 1, len(header)) + header)
+        with self.assertRaises(ValueError):
+            unpack(BINARY_HEADER.pack(b'FXCB', 1, 3) + b'{no' + b'\0' * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
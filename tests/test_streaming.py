@@ -0,0 +1,100 @@
+from collections import namedtuple
+import unittest
+
+import numpy as np
+import talib
+
+from tradingalgo.algo import ichimoku_cloud
+from tradingalgo.streaming import Atr
+from tradingalgo.streaming import BBands
+from tradingalgo.streaming import Dmi
+from tradingalgo.streaming import Ema
+from tradingalgo.streaming import Ichimoku
+from tradingalgo.streaming import IndicatorEngine
+from tradingalgo.streaming import Macd
+from tradingalgo.streaming import Rsi
+from tradingalgo.streaming import Sma
+
+Candle = namedtuple('Candle', ('time', 'open', 'close', 'high', 'low', 'volume'))
+
+
+def random_candles(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    closes = np.round(107 + np.cumsum(rng.normal(0, 0.02, rows)), 3)
+    highs = closes + np.round(rng.uniform(0, 0.01, rows), 3)
+    lows = closes - np.round(rng.uniform(0, 0.01, rows), 3)
+    return [Candle(i, c, c, h, l, 1.0) for i, (c, h, l) in enumerate(zip(closes, highs, lows))]
+
+
+def batch_cases(candles):
+    closes = np.array([c.close for c in candles])
+    highs = np.array([c.high for c in candles])
+    lows = np.array([c.low for c in candles])
+    return [
+        (Sma(7), talib.SMA(closes, 7)),
+        (Ema(25), talib.EMA(closes, 25)),
+        (BBands(20, 2.0), talib.BBANDS(closes, 20, 2.0, 2.0, 0)),
+        (Rsi(14), talib.RSI(closes, 14)),
+        (Atr(14), talib.ATR(highs, lows, closes, 14)),
+        (Dmi(14), (talib.PLUS_DI(highs, lows, closes, 14), talib.MINUS_DI(highs, lows, closes, 14),
+                   talib.ADX(highs, lows, closes, 14), talib.ADXR(highs, lows, closes, 14))),
+        (Macd(12, 26, 9), talib.MACD(closes, 12, 26, 9)),
+        (Ichimoku(), tuple(ichimoku_cloud(closes.tolist()))),
+    ]
+
+
+def as_array(values):
+    if isinstance(values, tuple):
+        return np.column_stack([np.asarray(v, dtype=np.float64) for v in values])
+    return np.asarray(values, dtype=np.float64)
+
+
+class StreamingIndicatorTest(unittest.TestCase):
+
+    def assertMatches(self, actual, expected, name):
+        actual, expected = as_array(actual), as_array(expected)
+        self.assertEqual(actual.shape, expected.shape, name)
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected), name)
+        np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9, err_msg=name)
+
+    def test_run_matches_batch(self):
+        candles = random_candles(300)
+        for indicator, expected in batch_cases(candles):
+            self.assertMatches(indicator.run(candles), expected, type(indicator).__name__)
+
+    def test_short_history(self):
+        candles = random_candles(5)
+        for indicator, expected in batch_cases(candles):
+            if isinstance(indicator, Ichimoku):
+                # ichimoku_cloud pads its shifted lines to 26 values on short input.
+                continue
+            self.assertMatches(indicator.run(candles), expected, type(indicator).__name__)
+
+    def test_engine_peek_update_and_revision(self):
+        candles = random_candles(120)
+        indicators = {type(i).__name__: i for i, _ in batch_cases(candles)}
+        expected = {name: indicator.run(candles) for name, indicator in indicators.items()}
+        engine = IndicatorEngine(indicators, history=1)
+        for i, candle in enumerate(candles):
+            peeked = engine.peek(candle)
+            wrong = candle._replace(close=candle.close * 1.01, high=candle.high * 1.02, low=candle.low * 0.98)
+            engine.update(candles[max(i - 1, 0):i] + [wrong])
+            updated = engine.update(candles[max(i - 1, 0):i + 1])
+            for name in indicators:
+                self.assertMatches([peeked[name][-1]], [expected[name][i]], name)
+                self.assertMatches([updated[name][-1]], [expected[name][i]], name)
+
+    def test_engine_reports_gaps(self):
+        candles = random_candles(10)
+        engine = IndicatorEngine({'sma': Sma(3)})
+        self.assertIsNotNone(engine.update(candles[:5]))
+        self.assertIsNone(engine.update(candles[7:]))
+        self.assertIsNone(engine.update([]))
+
+    def test_dmi_period(self):
+        with self.assertRaises(ValueError):
+            Dmi(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,15 +43,38 @@ def ichimoku_cloud(in_real):
     return tenkan, kijun, senkou_a, senkou_b, chikou
 
 
-def force_index(close, volume, period):
-    force_idx = [0]
+def ichimoku_cloud_arrays(closes: np.ndarray):
+    """Same lines as ichimoku_cloud for a float64 array, with talib rolling min/max."""
+    length = len(closes)
+    if length < 26:
+        return tuple(np.asarray(values, dtype=np.float64) for values in ichimoku_cloud(closes.tolist()))
+
+    def mid_price(period):
+        # Mid of the ``period`` closes before each candle, 0 until there are enough.
+        values = np.zeros(length)
+        if length > period:
+            values[period:] = (talib.MIN(closes, period)[period - 1:-1] +
+                               talib.MAX(closes, period)[period - 1:-1]) / 2
+        return values
+
+    tenkan = mid_price(9)
+    kijun = mid_price(26)
+    senkou_a = np.zeros(length)
+    senkou_a[52:] = ((tenkan + kijun) / 2)[26:-26]
+    senkou_b = np.zeros(length)
+    senkou_b[26:] = mid_price(52)[:-26]
+    chikou = np.zeros(length)
+    chikou[26:] = closes[:-26]
+    return tenkan, kijun, senkou_a, senkou_b, chikou
+
 
-    for i in range(1, len(close)):
-        force = (close[i] - close[i - 1]) * volume[i]
-        force_idx.append(force)
+def force_index(close, volume, period):
+    close = np.asarray(close, dtype=np.float64)
+    force_idx = np.zeros(max(len(close), 1))
+    force_idx[1:] = np.diff(close) * np.asarray(volume, dtype=np.float64)[1:]
     if period == 1:
-        return force_idx
+        return [0] + force_idx[1:].tolist()
     else:
-        ave_force_idx = talib.EMA(np.array(force_idx), period)
+        ave_force_idx = talib.EMA(force_idx, period)
         return nan_to_zero(ave_force_idx).tolist()
 
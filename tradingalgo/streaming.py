@@ -0,0 +1,346 @@
+"""Indicators updated one candle at a time.
+
+Each indicator follows the algorithm of the talib function of the same
+name (or ``algo.ichimoku_cloud``) step by step, so a stream of candles
+gives the same values as the batch functions over the same history, up
+to the rounding of the last digit.
+
+Indicators are stateless: ``step(state, candle)`` returns the value for
+``candle`` and the next state, and never modifies ``state``. States are
+tuples of bounded size, so keeping an old state to evaluate a
+provisional candle or to revise the last one costs nothing.
+"""
+from collections import namedtuple
+import math
+
+NAN = float('nan')
+
+BBandsValue = namedtuple('BBandsValue', ('up', 'mid', 'down'))
+DmiValue = namedtuple('DmiValue', ('plus_di', 'minus_di', 'adx', 'adxr'))
+MacdValue = namedtuple('MacdValue', ('macd', 'signal', 'hist'))
+IchimokuValue = namedtuple('IchimokuValue', ('tenkan', 'kijun', 'senkou_a', 'senkou_b', 'chikou'))
+
+
+def is_zero(value):
+    return -0.00000001 < value < 0.00000001
+
+
+def true_range(high, low, prev_close):
+    return max(high - low, abs(high - prev_close), abs(low - prev_close))
+
+
+def mid_price(values):
+    return (min(values) + max(values)) / 2
+
+
+class StreamingIndicator(object):
+    def initial_state(self):
+        raise NotImplementedError
+
+    def step(self, state, candle):
+        raise NotImplementedError
+
+    def run(self, candles):
+        """Values for every candle of ``candles``, as the batch function returns them."""
+        state = self.initial_state()
+        values = []
+        for candle in candles:
+            value, state = self.step(state, candle)
+            values.append(value)
+        return values
+
+
+class Sma(StreamingIndicator):
+    def __init__(self, period):
+        self.period = period
+
+    def initial_state(self):
+        # Running total without the oldest close, last period - 1 closes.
+        return 0.0, ()
+
+    def step(self, state, candle):
+        total, window = state
+        if len(window) < self.period - 1:
+            return NAN, (total + candle.close, window + (candle.close,))
+        total += candle.close
+        window += (candle.close,)
+        return total / self.period, (total - window[0], window[1:])
+
+
+class Ema(StreamingIndicator):
+    """EMA seeded with the SMA of the first ``period`` values."""
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+
+    def initial_state(self):
+        # Number of values seen (capped), then sum of the seed values or previous EMA.
+        return 0, 0.0
+
+    def step_value(self, state, value):
+        count, prev = state
+        if count < self.period - 1:
+            return NAN, (count + 1, prev + value)
+        if count == self.period - 1:
+            ema = (prev + value) / self.period
+        else:
+            ema = ((value - prev) * self.k) + prev
+        return ema, (self.period, ema)
+
+    def step(self, state, candle):
+        return self.step_value(state, candle.close)
+
+
+class BBands(StreamingIndicator):
+    """Bollinger bands around the SMA of ``n`` closes.
+
+    The variance is summed around the mean over the window, as talib
+    does, rather than from a running sum of squares which loses most of
+    its digits when the prices barely move.
+    """
+
+    def __init__(self, n, k):
+        self.n = n
+        self.k = k
+
+    def initial_state(self):
+        return 0.0, ()
+
+    def step(self, state, candle):
+        total, window = state
+        if len(window) < self.n - 1:
+            return BBandsValue(NAN, NAN, NAN), (total + candle.close, window + (candle.close,))
+        total += candle.close
+        window += (candle.close,)
+        mid = total / self.n
+        variance = 0.0
+        for close in window:
+            variance += (close - mid) * (close - mid)
+        variance /= self.n
+        dev = (math.sqrt(variance) if variance >= 0.00000001 else 0.0) * self.k
+        return BBandsValue(mid + dev, mid, mid - dev), (total - window[0], window[1:])
+
+
+class Rsi(StreamingIndicator):
+    """Wilder's RSI, the average gain and loss seeded over ``period`` changes."""
+
+    def __init__(self, period):
+        self.period = period
+
+    def initial_state(self):
+        return 0, 0.0, 0.0, 0.0
+
+    def step(self, state, candle):
+        count, prev_close, gain, loss = state
+        close = candle.close
+        if count == 0:
+            return NAN, (1, close, 0.0, 0.0)
+        change = close - prev_close
+        if count <= self.period:
+            if change < 0:
+                loss -= change
+            else:
+                gain += change
+            if count < self.period:
+                return NAN, (count + 1, close, gain, loss)
+            loss /= self.period
+            gain /= self.period
+        else:
+            loss *= (self.period - 1)
+            gain *= (self.period - 1)
+            if change < 0:
+                loss -= change
+            else:
+                gain += change
+            loss /= self.period
+            gain /= self.period
+        total = gain + loss
+        value = 100.0 * (gain / total) if not is_zero(total) else 0.0
+        return value, (self.period + 1, close, gain, loss)
+
+
+class Atr(StreamingIndicator):
+    """Wilder's ATR, seeded with the SMA of the first ``period`` true ranges."""
+
+    def __init__(self, period):
+        self.period = period
+
+    def initial_state(self):
+        return 0, 0.0, 0.0
+
+    def step(self, state, candle):
+        count, prev_close, atr = state
+        if count == 0:
+            return NAN, (1, candle.close, 0.0)
+        tr = true_range(candle.high, candle.low, prev_close)
+        if count < self.period:
+            return NAN, (count + 1, candle.close, atr + tr)
+        if count == self.period:
+            atr = (atr + tr) / self.period
+        else:
+            atr = ((atr * (self.period - 1)) + tr) / self.period
+        return atr, (self.period + 1, candle.close, atr)
+
+
+class Dmi(StreamingIndicator):
+    """+DI, -DI, ADX and ADXR over ``period`` (talib PLUS_DI, MINUS_DI, ADX, ADXR)."""
+
+    def __init__(self, period):
+        if period < 2:
+            raise ValueError('period must be at least 2')
+        self.period = period
+
+    def initial_state(self):
+        # count, previous high/low/close, smoothed +DM/-DM/TR, DX sum, ADX, last period - 1 ADX
+        return 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, NAN, ()
+
+    def step(self, state, candle):
+        count, prev_high, prev_low, prev_close, plus_dm, minus_dm, tr, sum_dx, adx, adx_window = state
+        n = self.period
+        high, low, close = candle.high, candle.low, candle.close
+        if count == 0:
+            return DmiValue(NAN, NAN, NAN, NAN), (1, high, low, close) + state[4:]
+
+        diff_p = high - prev_high
+        diff_m = prev_low - low
+        plus_move = diff_p if diff_p > 0 and diff_p > diff_m else 0.0
+        minus_move = diff_m if diff_m > 0 and diff_p < diff_m else 0.0
+        if count < n:
+            return DmiValue(NAN, NAN, NAN, NAN), (
+                count + 1, high, low, close, plus_dm + plus_move, minus_dm + minus_move,
+                tr + true_range(high, low, prev_close), sum_dx, adx, adx_window)
+
+        plus_dm = plus_dm - (plus_dm / n) + plus_move
+        minus_dm = minus_dm - (minus_dm / n) + minus_move
+        tr = tr - (tr / n) + true_range(high, low, prev_close)
+        plus_di = minus_di = 0.0
+        dx = None
+        if not is_zero(tr):
+            plus_di = 100.0 * (plus_dm / tr)
+            minus_di = 100.0 * (minus_dm / tr)
+            if not is_zero(minus_di + plus_di):
+                dx = 100.0 * (abs(minus_di - plus_di) / (minus_di + plus_di))
+
+        if count < 2 * n - 1:
+            if dx is not None:
+                sum_dx += dx
+        elif count == 2 * n - 1:
+            if dx is not None:
+                sum_dx += dx
+            adx = sum_dx / n
+        elif dx is not None:
+            adx = ((adx * (n - 1)) + dx) / n
+
+        adxr = NAN
+        if not math.isnan(adx):
+            if len(adx_window) == n - 1:
+                adxr = (adx + adx_window[0]) / 2.0
+            adx_window = (adx_window + (adx,))[-(n - 1):]
+        next_state = (min(count + 1, 2 * n), high, low, close, plus_dm, minus_dm, tr, sum_dx, adx, adx_window)
+        return DmiValue(plus_di, minus_di, adx, adxr), next_state
+
+
+class Macd(StreamingIndicator):
+    """MACD as talib computes it: both EMAs give their first value on the same candle."""
+
+    def __init__(self, fast_period, slow_period, signal_period):
+        if slow_period < fast_period:
+            fast_period, slow_period = slow_period, fast_period
+        self.fast = Ema(fast_period)
+        self.slow = Ema(slow_period)
+        self.signal = Ema(signal_period)
+
+    def initial_state(self):
+        return 0, self.fast.initial_state(), self.slow.initial_state(), self.signal.initial_state()
+
+    def step(self, state, candle):
+        count, fast_state, slow_state, signal_state = state
+        slow_period = self.slow.period
+        slow, slow_state = self.slow.step_value(slow_state, candle.close)
+        if count >= slow_period - self.fast.period:
+            fast, fast_state = self.fast.step_value(fast_state, candle.close)
+        if count < slow_period - 1:
+            return MacdValue(NAN, NAN, NAN), (count + 1, fast_state, slow_state, signal_state)
+
+        macd = fast - slow
+        signal, signal_state = self.signal.step_value(signal_state, macd)
+        next_state = (slow_period, fast_state, slow_state, signal_state)
+        if math.isnan(signal):
+            return MacdValue(NAN, NAN, NAN), next_state
+        return MacdValue(macd, signal, macd - signal), next_state
+
+
+class Ichimoku(StreamingIndicator):
+    """Same lines as ``algo.ichimoku_cloud``, 0 until there is enough history.
+
+    Each line only depends on the closes before the candle, so the
+    candle's own close does not change its values.
+    """
+
+    def initial_state(self):
+        # count, last 52 closes, last 26 senkou A / senkou B before the shift
+        return 0, (), (), ()
+
+    def step(self, state, candle):
+        count, closes, raw_a, raw_b = state
+        tenkan = mid_price(closes[-9:]) if count >= 9 else 0
+        kijun = mid_price(closes[-26:]) if count >= 26 else 0
+        senkou_a = raw_a[0] if count >= 26 else 0
+        senkou_b = raw_b[0] if count >= 26 else 0
+        chikou = closes[-26] if count >= 26 else 0
+        next_a = (tenkan + kijun) / 2 if count >= 26 else 0
+        next_b = mid_price(closes) if count >= 52 else 0
+        next_state = (min(count + 1, 52), (closes + (candle.close,))[-52:],
+                      (raw_a + (next_a,))[-26:], (raw_b + (next_b,))[-26:])
+        return IchimokuValue(tenkan, kijun, senkou_a, senkou_b, chikou), next_state
+
+
+class IndicatorEngine(object):
+    """Named streaming indicators over the candles of one product/duration.
+
+    ``update`` commits candles in time order. A candle with the same time
+    as the last committed one replaces it, so the open candle can be
+    committed again on every tick. ``peek`` evaluates one more candle
+    without committing it. Once seeded, each call costs the same whatever
+    the length of the history.
+    """
+
+    def __init__(self, indicators, history=4):
+        self.indicators = indicators
+        self.history = history
+        self.states = {name: indicator.initial_state() for name, indicator in indicators.items()}
+        self.values = {name: () for name in indicators}
+        self.time = None
+        self.previous = None
+
+    def _advance(self, states, values, candle):
+        next_states, next_values = {}, {}
+        for name, indicator in self.indicators.items():
+            value, next_states[name] = indicator.step(states[name], candle)
+            next_values[name] = (values[name] + (value,))[-self.history:]
+        return next_states, next_values
+
+    def commit(self, candle):
+        if self.time is None or candle.time > self.time:
+            self.previous = self.states, self.values
+        elif candle.time < self.time:
+            return
+        self.states, self.values = self._advance(*self.previous, candle)
+        self.time = candle.time
+
+    def update(self, candles):
+        """Commit ``candles`` and return the last ``history`` values of each indicator.
+
+        Returns None when ``candles`` start after the last committed candle:
+        candles may be missing and the engine has to be seeded again.
+        """
+        if self.time is not None and (not len(candles) or candles[0].time > self.time):
+            return None
+        for candle in candles:
+            self.commit(candle)
+        return self.values
+
+    def peek(self, candle):
+        """Values as ``update`` returns them, with ``candle`` following the committed candles."""
+        return self._advance(self.states, self.values, candle)[1]
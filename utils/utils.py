@@ -16,3 +16,16 @@ class Serializer(object):
             return None
         return self.__dict__
 
+
+class lazy_property(object):
+    """Attribute computed by the decorated method on first access, then stored on the instance."""
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.func.__name__] = self.func(instance)
+        return value